@@ -1,5 +1,8 @@
 from django import template
 
+from management.assets import asset_url
+from management.images import variant_url
+
 register = template.Library()
 
 
@@ -11,3 +14,13 @@ def get(d, key):
 @register.filter
 def uppercase(value):
     return value.upper()
+
+
+@register.filter
+def asset(name):
+    return asset_url(name)
+
+
+@register.filter
+def cover(instance, variant="thumb.webp"):
+    return variant_url(instance, variant)
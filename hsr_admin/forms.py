@@ -17,6 +17,12 @@ class ReservationForm(forms.ModelForm):
         fields = "__all__"
 
 
+class ReservationSearchForm(forms.Form):
+    q = forms.CharField(required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+
+
 class CheckAvailabilityForm(forms.Form):
     arrival_date = forms.DateField()
     arrival_time = forms.TimeField()
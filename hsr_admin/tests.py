@@ -1,3 +1,53 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import OperationalError
 from django.test import TestCase
+from django.urls import reverse
+
+from management.models import Reservation, Room, RoomCategory
+
+
+class NewReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = RoomCategory.objects.create(title="Standard", price=100)
+        cls.room = Room.objects.create(category=category, number="1")
+        cls.user = User.objects.create_user("admin", "admin@example.com", "secret")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self):
+        return self.client.post(
+            reverse("hsr_admin:new_reservation"),
+            {
+                "arrival_date": "2030-01-10",
+                "arrival_time": "14:00",
+                "departure_date": "2030-01-12",
+                "departure_time": "10:00",
+                "first_name": "Ada",
+                "last_name": "Test",
+                "email_address": "ada@example.com",
+                "phone_number": "08012345678",
+                "identification_type": "national_id",
+                "identification_number": "12345678901",
+                "room": self.room.pk,
+            },
+        )
+
+    def test_books_the_room(self):
+        response = self.post()
+        self.assertRedirects(response, reverse("hsr_admin:reservation_list"))
+        self.assertEqual(Reservation.objects.get().room, self.room)
+
+    def test_locked_database_renders_the_form_again(self):
+        with mock.patch(
+            "management.managers.RoomManager.book_room",
+            side_effect=OperationalError("database is locked"),
+        ):
+            response = self.post()
 
-# Create your tests here.
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "please try again")
+        self.assertFalse(Reservation.objects.exists())
@@ -17,6 +17,7 @@ urlpatterns = [
     path("reservations/", views.reservation_list, name="reservation_list"),
     path("reservations/new/", views.new_reservation, name="new_reservation"),
     path("reservations/check/", views.check_availability, name="check_availability"),
+    path("reservations/seen/", views.mark_all_seen, name="mark_all_seen"),
     path(
         "reservations/<int:pk>/delete/",
         views.delete_reservation,
@@ -3,13 +3,18 @@ from django.http.request import HttpRequest
 from django.http.response import HttpResponse
 from django.contrib.auth import login, logout
 from django.contrib.auth.models import User
+from django.core.paginator import Paginator
 from django.db.models import Q, F
-from django.db import transaction
+from django.db import OperationalError
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from django.utils.datetime_safe import datetime
+from datetime import timedelta
 
+from management.filters import search_reservations
 from management.models import RoomCategory, Room, Customer, Reservation
-from management.managers import RoomManager
+from management.managers import DailyStats, ReservationManager, RoomManager
+from management.cache import dashboard_counters
 
 from .forms import (
     BookingForm,
@@ -18,6 +23,7 @@ from .forms import (
     CustomerForm,
     LoginForm,
     ReservationForm,
+    ReservationSearchForm,
     CategoryForm,
     RoomFilterForm,
     RoomUpdateForm,
@@ -25,15 +31,25 @@ from .forms import (
 
 # Create your views here.
 
+RESERVATIONS_PER_PAGE = 25
+
 
 def new_reservations():
-    return Reservation.objects.filter(viewed=False).count()
+    return dashboard_counters.get()["new_reservations"]
+
+
+def query_without(request: HttpRequest, param: str) -> str:
+    """The query string of the request without param, for page links"""
+    query = request.GET.copy()
+    query.pop(param, None)
+    return query.urlencode()
 
 
 def context_parse(context):
-    context["status__"] = new_reservations()
-    context["status__category"] = RoomCategory.objects.all().count()
-    context["status__room"] = Room.objects.all().count()
+    counters = dashboard_counters.get()
+    context["status__"] = counters["new_reservations"]
+    context["status__category"] = counters["categories"]
+    context["status__room"] = counters["rooms"]
 
     return context
 
@@ -84,8 +100,22 @@ def user_logout(request: HttpRequest):
 def home(request: HttpRequest):
     if not request.user.is_authenticated:
         return redirect("hsr_admin:index")
+
+    tomorrow = timezone.localdate() + timedelta(days=1)
+    year = DailyStats.kpis(tomorrow - timedelta(days=365), tomorrow)
+    month = DailyStats.kpis(tomorrow - timedelta(days=30), tomorrow)
     return render(
-        request, template_name="hsr_admin/dashboard.html", context=context_parse({})
+        request,
+        template_name="hsr_admin/dashboard.html",
+        context=context_parse(
+            {
+                "kpis": (
+                    ("Last 30 days", month["total"]),
+                    ("Last 365 days", year["total"]),
+                ),
+                "category_kpis": year["categories"],
+            }
+        ),
     )
 
 
@@ -124,11 +154,8 @@ def new_category(request: HttpRequest):
 
     if rooms:
         try:
-            rooms = int(rooms)
-            for i in range(rooms):
-                room = Room(category=category)
-                room.save()
-        except Exception as e:
+            RoomManager.provision_rooms(category, int(rooms))
+        except ValueError:
             pass
 
     return redirect("hsr_admin:category_list")
@@ -138,18 +165,49 @@ def reservation_list(request: HttpRequest):
     if not request.user.is_authenticated:
         return redirect(index)
 
-    reservations = Reservation.objects.filter(viewed=True).order_by("-id")
-    new_reservations = Reservation.objects.filter(viewed=False).order_by("-id")
+    form = ReservationSearchForm(request.GET)
+    search = form.cleaned_data if form.is_valid() else {}
+
+    reservations = search_reservations(
+        Reservation.objects.select_related("room__category", "customer"),
+        search.get("q", ""),
+        search.get("start"),
+        search.get("end"),
+    ).order_by("-id")
+
+    # The new and seen reservations are paged separately
+    new_page = Paginator(
+        reservations.filter(viewed=False), RESERVATIONS_PER_PAGE
+    ).get_page(request.GET.get("new_page"))
+    page = Paginator(reservations.filter(viewed=True), RESERVATIONS_PER_PAGE).get_page(
+        request.GET.get("page")
+    )
 
     return render(
         request,
         "hsr_admin/reservation_list.html",
         context_parse(
-            {"reservations": reservations, "new_reservations": new_reservations}
+            {
+                "reservations": page,
+                "new_reservations": new_page,
+                "search": request.GET,
+                "page_query": query_without(request, "page"),
+                "new_page_query": query_without(request, "new_page"),
+            }
         ),
     )
 
 
+def mark_all_seen(request: HttpRequest):
+    if not request.user.is_authenticated:
+        return redirect(index)
+
+    if request.method == "POST":
+        ReservationManager.mark_all_viewed()
+
+    return redirect("hsr_admin:reservation_list")
+
+
 def room_list(request: HttpRequest):
     if not request.user.is_authenticated:
         return redirect(index)
@@ -163,7 +221,7 @@ def room_list(request: HttpRequest):
 
         rooms = RoomManager.taken_rooms(start_date=start_date, end_date=end_date)
     else:
-        rooms = Room.objects.all()
+        rooms = Room.objects.select_related("category")
 
     categories = RoomCategory.objects.all()
 
@@ -268,13 +326,8 @@ def view_category(request: HttpRequest, pk):
                 count = request.POST["count"]
 
                 try:
-                    count = int(count)
-                    for i in range(count):
-                        room = Room(category=category, number=Room.objects.count() + 1)
-
-                        room.save()
-
-                except Exception as e:
+                    RoomManager.provision_rooms(category, int(count))
+                except ValueError as e:
                     print(e)
 
                 return redirect("hsr_admin:view_category", pk=category.pk)
@@ -334,8 +387,7 @@ def delete_reservation(request, pk):
 
     reservation = Reservation.objects.get(pk=pk)
 
-    reservation.viewed = True
-    reservation.save()
+    ReservationManager.mark_viewed(reservation)
 
     if request.method == "POST":
         reservation.delete()
@@ -355,8 +407,7 @@ def view_reservation(request, pk):
     try:
         reservation = Reservation.objects.get(pk=pk)
 
-        reservation.viewed = True
-        reservation.save()
+        ReservationManager.mark_viewed(reservation)
 
         return render(
             request,
@@ -595,14 +646,35 @@ def new_reservation(request: HttpRequest):
             departure_date=departure,
             reservated_on=datetime.now(),
             paid=True,
-            room=room,
         )
 
-        with transaction.atomic():
-            customer.save()
-            reservation.save()
+        try:
+            booked = RoomManager.book_room(room.pk, reservation)
+        except OperationalError:
+            return render(
+                request,
+                "hsr_admin/new_reservation.html",
+                context=context_parse(
+                    {
+                        "message": "Too many bookings are being made right now, please try again",
+                        "form": request.POST,
+                    }
+                ),
+            )
 
-            return redirect("hsr_admin:reservation_list")
+        if not booked:
+            return render(
+                request,
+                "hsr_admin/new_reservation.html",
+                context=context_parse(
+                    {
+                        "message": "The selected room is not available for the selected dates",
+                        "form": request.POST,
+                    }
+                ),
+            )
+
+        return redirect("hsr_admin:reservation_list")
 
     else:
         form = ReservationForm()
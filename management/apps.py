@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ManagementConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "management"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .sqlite import apply_pragmas
+
+        connection_created.connect(apply_pragmas)
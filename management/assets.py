@@ -0,0 +1,393 @@
+"""
+Static asset pipeline.
+
+`build_static` copies STATIC_ROOT into STATIC_BUILD_ROOT. Every file is
+written under its own path and under a content hashed one
+(`css/site.css` -> `css/site.3f2a9c1e04b7.css`, the Vite bundles in
+`assets/` are already hashed and keep their name), compressible files get
+`.br` and `.gz` variants next to them, and `manifest.json` records it all.
+
+`serve_asset` serves the build: the precompressed variant accepted by the
+client, byte ranges, strong ETags, and `immutable` caching for the hashed
+names while the plain names are revalidated. Until a build exists the files
+are served from STATIC_ROOT as they are.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import brotli
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import require_safe
+
+
+MANIFEST_NAME = "manifest.json"
+
+# Names already carrying a content hash, like the Vite bundles
+HASHED_NAME = re.compile(r"[-.][0-9a-f]{8,}\.[^./]+$")
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/xml",
+    "image/svg+xml",
+    "font/ttf",
+    "font/otf",
+    "application/vnd.ms-fontobject",
+)
+COMPRESSIBLE_EXTENSIONS = (".map", ".ttf", ".otf", ".eot")
+
+# A variant is only kept if it saves at least 5%
+MIN_COMPRESSION_RATIO = 0.95
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+
+def build_root() -> Path:
+    return Path(settings.STATIC_BUILD_ROOT)
+
+
+def content_type(name: str) -> str:
+    guessed, _ = mimetypes.guess_type(name)
+    return guessed or "application/octet-stream"
+
+
+def is_compressible(name: str) -> bool:
+    return name.endswith(COMPRESSIBLE_EXTENSIONS) or content_type(name).startswith(
+        COMPRESSIBLE_TYPES
+    )
+
+
+def hashed_name(name: str, digest: str) -> str:
+    if HASHED_NAME.search(name):
+        return name
+    stem, dot, extension = name.rpartition(".")
+    if not dot or "/" in extension:
+        return f"{name}.{digest}"
+    return f"{stem}.{digest}.{extension}"
+
+
+def compress(data: bytes) -> dict[str, bytes]:
+    variants = {
+        "br": brotli.compress(data, quality=11),
+        "gzip": gzip.compress(data, compresslevel=9, mtime=0),
+    }
+
+    return {
+        encoding: compressed
+        for encoding, compressed in variants.items()
+        if len(compressed) < len(data) * MIN_COMPRESSION_RATIO
+    }
+
+
+def write_file(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def link_file(source: Path, target: Path):
+    """Hard links target to source, copies where links are not supported"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+def build_file(source_root: Path, target_root: Path, name: str) -> dict:
+    data = (source_root / name).read_bytes()
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    hashed = hashed_name(name, digest)
+
+    variants = compress(data) if is_compressible(name) else {}
+
+    write_file(target_root / hashed, data)
+    for encoding, compressed in variants.items():
+        write_file(target_root / (hashed + ENCODINGS[encoding]), compressed)
+
+    if hashed != name:
+        link_file(target_root / hashed, target_root / name)
+        for encoding in variants:
+            suffix = ENCODINGS[encoding]
+            link_file(target_root / (hashed + suffix), target_root / (name + suffix))
+
+    return {
+        "hashed": hashed,
+        "hash": digest,
+        "size": len(data),
+        "encodings": {
+            encoding: len(compressed) for encoding, compressed in variants.items()
+        },
+    }
+
+
+def build(source_root: Path, target_root: Path, workers: int = 4) -> dict:
+    """
+    Builds target_root from source_root and writes its manifest, returns
+    the manifest
+    """
+    names = sorted(
+        path.relative_to(source_root).as_posix()
+        for path in source_root.rglob("*")
+        if path.is_file()
+    )
+
+    # zlib and brotli release the GIL, the files are compressed in parallel
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        entries = executor.map(
+            lambda name: build_file(source_root, target_root, name), names
+        )
+        files = dict(zip(names, entries))
+
+    manifest = {"version": 1, "files": files}
+
+    # Written last, a partial build is never served as a complete one
+    temporary = target_root / (MANIFEST_NAME + ".tmp")
+    temporary.write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    os.replace(temporary, target_root / MANIFEST_NAME)
+
+    _manifest_cache.clear()
+    return manifest
+
+
+class Asset:
+    """A file of the build resolved from a requested name"""
+
+    __slots__ = ("path", "etag", "immutable", "encodings")
+
+    def __init__(self, path: Path, etag: str, immutable: bool, encodings):
+        self.path = path
+        self.etag = etag
+        self.immutable = immutable
+        self.encodings = encodings
+
+
+_manifest_cache: dict = {}
+
+
+def load_manifest() -> dict | None:
+    """
+    The manifest of the build keyed by plain and hashed names, reloaded when
+    a new build replaces it, None if there is no build
+    """
+    path = build_root() / MANIFEST_NAME
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    if _manifest_cache.get("mtime") != mtime:
+        files = json.loads(path.read_text())["files"]
+        names = {}
+        for name, entry in files.items():
+            names[name] = (entry, entry["hashed"] == name)
+            names[entry["hashed"]] = (entry, True)
+        _manifest_cache.update(mtime=mtime, names=names)
+
+    return _manifest_cache["names"]
+
+
+def resolve(name: str) -> Asset | None:
+    """The asset served for a requested name, None if there is none"""
+    manifest = load_manifest()
+
+    if manifest is None:
+        # No build, the source files as they are
+        try:
+            path = Path(safe_join(settings.STATIC_ROOT, name))
+            stat = path.stat()
+        except (SuspiciousFileOperation, OSError, ValueError):
+            return None
+        if not path.is_file():
+            return None
+        return Asset(path, f"{stat.st_mtime_ns:x}-{stat.st_size:x}", False, ())
+
+    if name not in manifest:
+        return None
+
+    entry, immutable = manifest[name]
+    return Asset(
+        build_root() / entry["hashed"], entry["hash"], immutable, entry["encodings"]
+    )
+
+
+def accepted_encodings(header: str) -> set[str]:
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    The (first, last) bytes of a single `bytes=` range, None if the header
+    can not be honoured and the whole file should be sent instead.
+    Raises ValueError if the range is not satisfiable
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+
+    first, dash, last = ranges.strip().partition("-")
+    if not dash:
+        return None
+
+    try:
+        if not first:
+            # The last `last` bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            return max(size - length, 0), size - 1
+
+        first = int(first)
+        last = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if first >= size:
+        raise ValueError("Range starts after the end of the file")
+    if first > last:
+        return None
+    return first, min(last, size - 1)
+
+
+class FileRange:
+    """Reads `length` bytes of a file from `offset`, for FileResponse"""
+
+    def __init__(self, file, offset: int, length: int):
+        self.file = file
+        self.remaining = length
+        file.seek(offset)
+
+    def read(self, size: int = -1) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+@require_safe
+def serve_asset(request, path: str):
+    asset = resolve(path)
+    if asset is None:
+        raise Http404(f"'{path}' could not be found")
+
+    cache_control = (
+        IMMUTABLE_CACHE_CONTROL if asset.immutable else REVALIDATE_CACHE_CONTROL
+    )
+    range_header = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if range_header and if_range and if_range.strip() != f'"{asset.etag}"':
+        range_header = None
+
+    # Ranges are served from the identity file, offsets into a compressed
+    # variant would be useless to most clients
+    encoding = None
+    if not range_header:
+        accepted = accepted_encodings(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        encoding = next(
+            (e for e in ENCODINGS if e in asset.encodings and e in accepted), None
+        )
+
+    etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+
+    if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+    if if_none_match and (
+        etag in parse_etags(if_none_match) or if_none_match.strip() == "*"
+    ):
+        return HttpResponseNotModified(headers=headers)
+
+    file_path = asset.path
+    if encoding:
+        file_path = Path(f"{asset.path}{ENCODINGS[encoding]}")
+    try:
+        file = file_path.open("rb")
+    except OSError:
+        raise Http404(f"'{path}' could not be found")
+
+    # Named after the requested asset, not the precompressed file read
+    filename = posixpath.basename(path)
+    stat = os.fstat(file.fileno())
+    size = stat.st_size
+    headers["Last-Modified"] = http_date(stat.st_mtime)
+    headers["Accept-Ranges"] = "bytes"
+
+    byte_range = None
+    if range_header:
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            file.close()
+            headers["Content-Range"] = f"bytes */{size}"
+            return HttpResponse(status=416, headers=headers)
+
+    if byte_range is None:
+        # The whole file, sent with the server's sendfile (wsgi.file_wrapper)
+        # when it has one
+        response = FileResponse(
+            file, content_type=content_type(asset.path.name), filename=filename
+        )
+        if encoding:
+            response["Content-Encoding"] = encoding
+    else:
+        first, last = byte_range
+        response = FileResponse(
+            FileRange(file, first, last - first + 1),
+            status=206,
+            content_type=content_type(asset.path.name),
+            filename=filename,
+        )
+        response["Content-Range"] = f"bytes {first}-{last}/{size}"
+        response["Content-Length"] = str(last - first + 1)
+
+    for key, value in headers.items():
+        response[key] = value
+    return response
+
+
+def asset_url(name: str) -> str:
+    """The hashed url of a static file, its plain url if there is no build"""
+    manifest = load_manifest()
+    if manifest is not None and name in manifest:
+        name = manifest[name][0]["hashed"]
+    return f"/{name}"
@@ -0,0 +1,32 @@
+"""
+Stay arithmetic shared by the availability queries and the nights ledger.
+
+A stay takes the nights from its arrival day up to (not including) its
+departure day, in the local timezone. Availability is decided by those nights
+(see RoomNight and RoomNightLedger), not by the exact arrival and departure
+times.
+"""
+from datetime import date, datetime, timedelta
+
+from django.utils import timezone
+
+
+def aware(value: datetime) -> datetime:
+    """
+    Makes a naive datetime aware in the current timezone, the same way the
+    ORM interprets naive datetimes when they are used in a query
+    """
+    if timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
+
+
+def stay_nights(arrival_date: datetime, departure_date: datetime) -> tuple[date, date]:
+    """
+    Returns the first night of a stay and the day after its last night, a
+    stay covers the nights first <= night < end (at least one night, even for
+    a same day arrival and departure)
+    """
+    first = timezone.localtime(aware(arrival_date)).date()
+    end = timezone.localtime(aware(departure_date)).date()
+    return first, max(end, first + timedelta(days=1))
@@ -0,0 +1,251 @@
+"""
+Availability cache in front of RoomManager.available_rooms.
+
+Entries are stored in the "availability" cache (see CACHES in the settings,
+a cache shared by every worker) keyed by category and normalized date window.
+Every entry remembers the version token of each day its window touches and
+of the room list; a reservation write replaces the tokens of the days of its
+stay, so exactly the entries whose window overlaps that stay stop matching,
+in every worker. Size and eviction are left to the cache backend, an evicted
+token is created again and only turns the entries holding the old one into
+misses.
+
+The catalog version is the modification time of the catalog, a row of the
+Sequence table shared by every worker and moved forward on every write to the
+categories, rooms and add-ons. It drives the ETag and Last-Modified headers
+of the catalog endpoints, and is kept in the default cache (local to the
+worker) for CATALOG_VERSION_TIMEOUT so a write made by another worker shows
+after that long at most.
+
+The dashboard counters (new reservations, categories, rooms) shown on every
+admin page are rows of the Sequence table too, counted from the database the
+first time they are read and then moved by the model signals in the
+transaction of each change.
+"""
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import caches
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .availability import aware
+
+
+ROOMS_KEY = "availability:rooms"
+
+# Windows spanning more days than this are not cached
+MAX_WINDOW_DAYS = 62
+
+
+def normalize(value: datetime) -> datetime:
+    return aware(value).astimezone(dt_timezone.utc)
+
+
+def window_days(start_date: datetime, end_date: datetime) -> list[date]:
+    """The UTC days touched by the half-open window [start_date, end_date)"""
+    first = normalize(start_date).date()
+    last = (normalize(end_date) - timedelta(microseconds=1)).date()
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+class AvailabilityCache:
+    def __init__(self, alias: str = "availability"):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def entry_key(self, category_id, start_date: datetime, end_date: datetime):
+        return (
+            f"availability:{category_id or 'all'}:"
+            f"{normalize(start_date).isoformat()}:{normalize(end_date).isoformat()}"
+        )
+
+    def tokens(self, days: list[date]) -> dict[str, str]:
+        """
+        The current version tokens of the room list and of every day,
+        missing tokens (never set or evicted) are created
+        """
+        keys = [ROOMS_KEY] + [f"availability:day:{day.isoformat()}" for day in days]
+        tokens = self.cache.get_many(keys)
+
+        missing = {key: uuid.uuid4().hex for key in keys if key not in tokens}
+        for key, token in missing.items():
+            if not self.cache.add(key, token, timeout=None):
+                token = self.cache.get(key, token)
+            tokens[key] = token
+
+        return tokens
+
+    def get_or_compute(
+        self, category_id, start_date: datetime, end_date: datetime, compute
+    ) -> list[int]:
+        """
+        Returns the cached free room ids of the window, or computes them with
+        `compute()` and caches them.
+        The tokens are read before computing, a write landing meanwhile
+        replaces them so the stored entry is never matched
+        """
+        days = window_days(start_date, end_date)
+        if len(days) > MAX_WINDOW_DAYS:
+            return compute()
+
+        key = self.entry_key(category_id, start_date, end_date)
+        tokens = self.tokens(days)
+
+        entry = self.cache.get(key)
+        if entry is not None and entry["tokens"] == tokens:
+            return entry["rooms"]
+
+        rooms = compute()
+        self.cache.set(key, {"tokens": tokens, "rooms": rooms})
+        return rooms
+
+    def invalidate_window(self, start_date: datetime, end_date: datetime):
+        self.cache.set_many(
+            {
+                f"availability:day:{day.isoformat()}": uuid.uuid4().hex
+                for day in window_days(start_date, end_date)
+            },
+            timeout=None,
+        )
+
+    def invalidate_rooms(self):
+        self.cache.set(ROOMS_KEY, uuid.uuid4().hex, timeout=None)
+
+
+availability_cache = AvailabilityCache()
+
+
+CATALOG_KEY = "catalog:version"
+CATALOG_SEQUENCE = "catalog_version"
+CATALOG_VERSION_TIMEOUT = 5
+
+
+def now_microseconds() -> int:
+    return int(timezone.now().timestamp() * 1_000_000)
+
+
+class CatalogVersion:
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def current(self) -> dict:
+        """
+        The current {"token", "modified"} version of the catalog, a catalog
+        never modified is created as modified now
+        """
+        from .models import Sequence
+
+        version = self.cache.get(CATALOG_KEY)
+        if version is None:
+            value = (
+                Sequence.objects.filter(name=CATALOG_SEQUENCE)
+                .values_list("value", flat=True)
+                .first()
+            )
+            if value is None:
+                value = Sequence.objects.get_or_create(
+                    name=CATALOG_SEQUENCE, defaults={"value": now_microseconds()}
+                )[0].value
+            version = self.to_version(value)
+            self.cache.set(CATALOG_KEY, version, timeout=CATALOG_VERSION_TIMEOUT)
+        return version
+
+    def bump(self):
+        """Moves the version to now, always forward"""
+        from .models import Sequence
+
+        versions = Sequence.objects.filter(name=CATALOG_SEQUENCE)
+        value = Greatest(F("value") + 1, now_microseconds())
+        if not versions.update(value=value):
+            _, created = Sequence.objects.get_or_create(
+                name=CATALOG_SEQUENCE, defaults={"value": now_microseconds()}
+            )
+            if not created:
+                versions.update(value=value)
+        self.cache.delete(CATALOG_KEY)
+
+    def to_version(self, value: int) -> dict:
+        return {
+            "token": f"{value:x}",
+            "modified": datetime.fromtimestamp(value / 1_000_000, dt_timezone.utc),
+        }
+
+    def etag(self, *parts) -> str:
+        return "-".join(
+            [self.current()["token"], *(str(part) for part in parts if part is not None)]
+        )
+
+    def last_modified(self) -> datetime:
+        return self.current()["modified"]
+
+
+catalog_version = CatalogVersion()
+
+
+class DashboardCounters:
+    names = ("new_reservations", "categories", "rooms")
+
+    def sequence(self, name: str) -> str:
+        return f"counter:{name}"
+
+    def count(self, name: str) -> int:
+        """Counts a counter from the database"""
+        from .models import Reservation, Room, RoomCategory
+
+        if name == "new_reservations":
+            return Reservation.objects.filter(viewed=False).count()
+        if name == "categories":
+            return RoomCategory.objects.count()
+        return Room.objects.count()
+
+    def get(self) -> dict[str, int]:
+        """The value of every counter, one never stored is counted first"""
+        from .models import Sequence
+
+        values = dict(
+            Sequence.objects.filter(
+                name__in=[self.sequence(name) for name in self.names]
+            ).values_list("name", "value")
+        )
+
+        counts = {}
+        for name in self.names:
+            key = self.sequence(name)
+            if key not in values:
+                values[key] = Sequence.objects.get_or_create(
+                    name=key, defaults={"value": self.count(name)}
+                )[0].value
+            counts[name] = values[key]
+        return counts
+
+    def add(self, name: str, delta: int):
+        """
+        Moves a counter by delta, called in the transaction of the change it
+        counts so both are committed or rolled back together
+        """
+        from .models import Sequence
+
+        # A counter never stored is counted on the next read
+        Sequence.objects.filter(name=self.sequence(name)).update(
+            value=F("value") + delta
+        )
+
+    def rebuild(self):
+        from .models import Sequence
+
+        for name in self.names:
+            Sequence.objects.update_or_create(
+                name=self.sequence(name), defaults={"value": self.count(name)}
+            )
+
+
+dashboard_counters = DashboardCounters()
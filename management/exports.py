@@ -0,0 +1,118 @@
+"""
+Streaming export of the reservations (with their customer, room and
+payment) as NDJSON or CSV. Rows are read in chunks with a server side
+iterator and written one line at a time, so memory use does not grow with
+the number of reservations.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+CHUNK_SIZE = 2000
+
+COLUMNS = (
+    "id",
+    "code",
+    "reservation_type",
+    "arrival_date",
+    "departure_date",
+    "reservated_on",
+    "stay",
+    "guest_count",
+    "paid",
+    "cancelled",
+    "cancelled_on",
+    "room_id",
+    "room_number",
+    "category",
+    "category_price",
+    "customer_first_name",
+    "customer_last_name",
+    "customer_email_address",
+    "customer_phone_number",
+    "customer_id_type",
+    "customer_id_number",
+    "payment_amount",
+    "payment_status",
+    "payment_date",
+    "payment_transaction_reference",
+)
+
+
+class Echo:
+    """File like object handing back what is written, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(reservations: QuerySet):
+    for reservation in (
+        reservations.select_related("room__category", "customer", "payment")
+        .order_by("pk")
+        .iterator(chunk_size=CHUNK_SIZE)
+    ):
+        customer = reservation.customer
+        payment = reservation.payment
+        room = reservation.room
+
+        yield {
+            "id": reservation.pk,
+            "code": reservation.code,
+            "reservation_type": reservation.reservation_type,
+            "arrival_date": reservation.arrival_date,
+            "departure_date": reservation.departure_date,
+            "reservated_on": reservation.reservated_on,
+            "stay": reservation.stay,
+            "guest_count": reservation.guest_count,
+            "paid": reservation.paid,
+            "cancelled": reservation.cancelled,
+            "cancelled_on": reservation.cancelled_on,
+            "room_id": room.pk,
+            "room_number": room.number,
+            "category": room.category.title,
+            "category_price": room.category.price,
+            "customer_first_name": customer.first_name if customer else None,
+            "customer_last_name": customer.last_name if customer else None,
+            "customer_email_address": customer.email_address if customer else None,
+            "customer_phone_number": customer.phone_number if customer else None,
+            "customer_id_type": customer.id_type if customer else None,
+            "customer_id_number": customer.id_number if customer else None,
+            "payment_amount": payment.amount if payment else None,
+            "payment_status": payment.status if payment else None,
+            "payment_date": payment.date if payment else None,
+            "payment_transaction_reference": (
+                payment.transaction_reference if payment else None
+            ),
+        }
+
+
+def ndjson_lines(reservations: QuerySet):
+    for row in export_rows(reservations):
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+def csv_lines(reservations: QuerySet):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in export_rows(reservations):
+        yield writer.writerow(
+            [
+                value.isoformat() if hasattr(value, "isoformat") else value
+                for value in row.values()
+            ]
+        )
+
+
+def export_lines(reservations: QuerySet, export_format: str):
+    if export_format == "csv":
+        return csv_lines(reservations)
+    return ndjson_lines(reservations)
@@ -0,0 +1,249 @@
+"""
+Read only serializers producing the same JSON as the ModelSerializers in
+management.serializers, built from `.values()` rows instead of model
+instances.
+
+Each serializer is compiled once into the list of ORM lookups it needs and
+a list of (output key, lookup, mapper) steps, serializing a row is then a
+walk over that list with no field objects or model instances involved.
+Used by the list endpoints when settings.FAST_READ_SERIALIZERS is on, the
+parity with the model serializers is tested in management.tests and the
+benchmark_serializers command times both.
+
+A serializer built with a FieldSet only outputs (and only reads) the fields
+asked for, its `lookups` and `narrow()` are also used to limit the columns
+loaded for the ModelSerializers.
+"""
+from functools import partial
+from types import SimpleNamespace
+
+from django.db.models import QuerySet
+from rest_framework import serializers
+
+from .fieldsets import FULL, FieldSet
+from .images import variant_urls
+from .models import Customer, RoomCategory
+
+
+_datetime_field = serializers.DateTimeField()
+
+
+def datetime_mapper(value):
+    return _datetime_field.to_representation(value)
+
+
+def file_mapper(model, field_name):
+    storage = model._meta.get_field(field_name).storage
+
+    def mapper(value):
+        return storage.url(value) if value else None
+
+    return mapper
+
+
+class Column:
+    def __init__(self, lookup: str, mapper=None):
+        self.lookup = lookup
+        self.mapper = mapper
+
+
+class Computed:
+    """A value computed from other columns, like a model property"""
+
+    def __init__(self, function, lookups: tuple[str, ...]):
+        self.function = function
+        self.lookups = lookups
+
+
+class Nested:
+    """A related object serialized by another fast serializer"""
+
+    def __init__(self, serializer_class, relation: str):
+        self.serializer_class = serializer_class
+        self.relation = relation
+
+
+class FastSerializer:
+    # (output key, Column | Computed | Nested)
+    fields: tuple = ()
+
+    def __init__(self, prefix: str = "", fieldset: FieldSet = FULL):
+        self.prefix = prefix
+        self.pk_lookup = prefix + "id"
+        # Always read, a null primary key means there is no related row
+        self.lookups: list[str] = [self.pk_lookup]
+        # The relations embedded in the output, for select_related
+        self.relations: list[str] = []
+        self.steps = []
+
+        fieldset.validate(
+            [key for key, _ in self.fields],
+            [key for key, field in self.fields if isinstance(field, Nested)],
+            prefix.replace("__", "."),
+        )
+
+        for key, field in self.fields:
+            if not fieldset.includes(key):
+                continue
+
+            if isinstance(field, Column):
+                lookup = prefix + field.lookup
+                self.lookups.append(lookup)
+                self.steps.append((key, "column", (lookup, field.mapper)))
+
+            elif isinstance(field, Computed):
+                lookups = tuple(prefix + lookup for lookup in field.lookups)
+                self.lookups.extend(lookups)
+                self.steps.append((key, "computed", (field.function, lookups)))
+
+            elif fieldset.expands(key):
+                relation = prefix + field.relation
+                nested = field.serializer_class(f"{relation}__", fieldset.child(key))
+                self.lookups.extend(nested.lookups)
+                self.relations.append(relation)
+                self.relations.extend(nested.relations)
+                self.steps.append((key, "nested", nested))
+
+            else:
+                # Not expanded, the related primary key
+                lookup = prefix + field.relation
+                self.lookups.append(lookup)
+                self.steps.append((key, "column", (lookup, None)))
+
+        self.lookups = list(dict.fromkeys(self.lookups))
+
+    def to_representation(self, row: dict) -> dict | None:
+        if row[self.pk_lookup] is None:
+            return None
+
+        data = {}
+        for key, kind, step in self.steps:
+            if kind == "column":
+                lookup, mapper = step
+                value = row[lookup]
+                data[key] = mapper(value) if mapper and value is not None else value
+            elif kind == "computed":
+                function, lookups = step
+                data[key] = function(*(row[lookup] for lookup in lookups))
+            else:
+                data[key] = step.to_representation(row)
+        return data
+
+    def values(self, queryset: QuerySet) -> QuerySet:
+        return queryset.values(*self.lookups)
+
+    def narrow(self, queryset: QuerySet) -> QuerySet:
+        """
+        Limits the model instances loaded by the queryset to the columns and
+        relations this serializer outputs
+        """
+        queryset = queryset.select_related(None)
+        if self.relations:
+            queryset = queryset.select_related(*self.relations)
+        return queryset.only(*self.lookups)
+
+    def serialize(self, queryset: QuerySet) -> list[dict]:
+        return [self.to_representation(row) for row in self.values(queryset)]
+
+
+def secure_property(name, *fields):
+    prop = getattr(Customer, name).fget
+
+    def function(*values):
+        return prop(SimpleNamespace(**dict(zip(fields, values))))
+
+    return Computed(function, fields)
+
+
+class FastRoomCategorySerializer(FastSerializer):
+    fields = (
+        ("pk", Column("id")),
+        ("title", Column("title")),
+        ("description", Column("description")),
+        ("price", Column("price", float)),
+        ("cover", Column("cover", file_mapper(RoomCategory, "cover"))),
+        (
+            "cover_variants",
+            Computed(
+                partial(variant_urls, RoomCategory._meta.get_field("cover").storage),
+                ("cover", "cover_hash"),
+            ),
+        ),
+    )
+
+
+class FastRoomSerializer(FastSerializer):
+    fields = (
+        ("pk", Column("id")),
+        ("number", Column("number")),
+        ("category", Nested(FastRoomCategorySerializer, "category")),
+        ("description", Column("description")),
+        ("unique", Column("unique", bool)),
+        ("addon", Column("addon")),
+    )
+
+
+class FastCustomerSerializer(FastSerializer):
+    fields = (
+        ("pk", Column("id")),
+        ("first_name", Column("first_name")),
+        ("last_name", Column("last_name")),
+        ("id_type", Column("id_type")),
+        ("id_number", Column("id_number")),
+        ("email_address", Column("email_address")),
+        ("phone_number", Column("phone_number")),
+    )
+
+
+class FastSecureCustomerSerializer(FastSerializer):
+    fields = (
+        ("pk", Column("id")),
+        ("first_name", Column("first_name")),
+        ("last_name", Column("last_name")),
+        ("id_type", Column("id_type")),
+        ("secure_id_number", secure_property("secure_id_number", "id_number")),
+        (
+            "secure_email_address",
+            secure_property("secure_email_address", "email_address"),
+        ),
+        (
+            "secure_phone_number",
+            secure_property("secure_phone_number", "phone_number"),
+        ),
+    )
+
+
+RESERVATION_FIELDS = (
+    ("pk", Column("id")),
+    ("room", Nested(FastRoomSerializer, "room")),
+    ("customer", Nested(FastCustomerSerializer, "customer")),
+    ("code", Column("code")),
+    ("reservation_type", Column("reservation_type")),
+    ("arrival_date", Column("arrival_date", datetime_mapper)),
+    ("departure_date", Column("departure_date", datetime_mapper)),
+    ("reservated_on", Column("reservated_on", datetime_mapper)),
+    ("stay", Column("stay", int)),
+    ("guest_count", Column("guest_count", int)),
+    ("guests", Column("guests")),
+    ("customization_request", Column("customization_request")),
+    ("paid", Column("paid", bool)),
+    ("payment", Column("payment")),
+    ("cancelled", Column("cancelled", bool)),
+    ("cancelled_on", Column("cancelled_on", datetime_mapper)),
+)
+
+
+class FastReservationSerializer(FastSerializer):
+    fields = RESERVATION_FIELDS
+
+
+class FastSecureReservationSerializer(FastSerializer):
+    # Same fields as SecureReservationSerializer, code comes before customer
+    fields = (
+        RESERVATION_FIELDS[:2]
+        + (
+            ("code", Column("code")),
+            ("customer", Nested(FastSecureCustomerSerializer, "customer")),
+        )
+        + RESERVATION_FIELDS[4:]
+    )
@@ -0,0 +1,79 @@
+"""
+Sparse fieldsets of the API responses.
+
+`?fields=pk,code,room.number` keeps only the listed fields, a dotted name
+selects fields of a nested object. `?expand=room,room.category` embeds only
+the listed relations, every other relation is rendered as its primary key,
+an empty `?expand=` renders all of them as keys. Without the parameters the
+full responses are returned, and asking for fields of a relation expands it.
+"""
+
+
+class FieldSetError(ValueError):
+    pass
+
+
+def parse_names(value: str) -> dict:
+    """'a,b.c,b.d' -> {"a": {}, "b": {"c": {}, "d": {}}}"""
+    tree = {}
+    for name in value.split(","):
+        name = name.strip()
+        if not name:
+            continue
+
+        node = tree
+        for part in name.split("."):
+            if not part:
+                raise FieldSetError(f"Invalid field name '{name}'")
+            node = node.setdefault(part, {})
+    return tree
+
+
+class FieldSet:
+    def __init__(self, fields: dict | None = None, expand: dict | None = None):
+        # None means every field / every relation
+        self.fields = fields
+        self.expand = expand
+
+    @classmethod
+    def from_params(cls, params) -> "FieldSet":
+        fields = params.get("fields")
+        expand = params.get("expand")
+        return cls(
+            parse_names(fields) if fields is not None else None,
+            parse_names(expand) if expand is not None else None,
+        )
+
+    @property
+    def is_full(self) -> bool:
+        return self.fields is None and self.expand is None
+
+    def includes(self, name: str) -> bool:
+        return self.fields is None or name in self.fields
+
+    def expands(self, name: str) -> bool:
+        return (
+            self.expand is None
+            or name in self.expand
+            or bool(self.fields and self.fields.get(name))
+        )
+
+    def child(self, name: str) -> "FieldSet":
+        fields = self.fields.get(name) or None if self.fields is not None else None
+        expand = self.expand.get(name, {}) if self.expand is not None else None
+        return FieldSet(fields, expand)
+
+    def validate(self, names, relations, path: str = ""):
+        """Raises FieldSetError for unknown field names or relations"""
+        for key in self.fields or ():
+            if key not in names:
+                raise FieldSetError(f"Unknown field '{path}{key}'")
+            if self.fields[key] and key not in relations:
+                raise FieldSetError(f"'{path}{key}' has no fields")
+
+        for key in self.expand or ():
+            if key not in relations:
+                raise FieldSetError(f"'{path}{key}' can not be expanded")
+
+
+FULL = FieldSet()
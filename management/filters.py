@@ -0,0 +1,134 @@
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Q, QuerySet
+from django.db.models.functions import Lower
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .managers import local_midnight
+from .models import Customer
+
+
+# query parameter -> reservation lookup of the date filters
+DATE_FILTERS = {
+    "after": "arrival_date__gte",
+    "before": "departure_date__lte",
+    "arrival_after": "arrival_date__gte",
+    "arrival_before": "arrival_date__lt",
+    "departure_after": "departure_date__gte",
+    "departure_before": "departure_date__lt",
+}
+
+BOOLEAN_FILTERS = ("cancelled", "paid", "viewed")
+
+TRUE_VALUES = ("1", "true", "yes")
+FALSE_VALUES = ("0", "false", "no")
+
+
+class FilterError(ValueError):
+    pass
+
+
+def parse_filter_date(value: str) -> datetime | None:
+    """Accepts a datetime or a date (midnight of that day)"""
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            parsed = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        parsed = None
+    return parsed
+
+
+def filter_reservations(reservations: QuerySet, params) -> QuerySet:
+    """
+    Applies the reservation filters found in the query parameters
+        after, before: arrival on or after / departure on or before
+        arrival_after, arrival_before, departure_after, departure_before
+        cancelled, paid, viewed: true or false
+        category: room category id
+    Raises FilterError when a value is invalid
+    """
+    for param, lookup in DATE_FILTERS.items():
+        value = params.get(param)
+        if not value:
+            continue
+
+        parsed = parse_filter_date(value)
+        if parsed is None:
+            raise FilterError(
+                f"An invalid {param.replace('_', ' ')} date was provided, make sure it is a valid date"
+            )
+        reservations = reservations.filter(**{lookup: parsed})
+
+    for param in BOOLEAN_FILTERS:
+        value = params.get(param)
+        if not value:
+            continue
+
+        if value.lower() in TRUE_VALUES:
+            reservations = reservations.filter(**{param: True})
+        elif value.lower() in FALSE_VALUES:
+            reservations = reservations.filter(**{param: False})
+        else:
+            raise FilterError(f"{param.title()} should be true or false")
+
+    category = params.get("category")
+    if category:
+        try:
+            reservations = reservations.filter(room__category=int(category))
+        except ValueError:
+            raise FilterError("An invalid room category was provided")
+
+    return reservations
+
+
+def prefix_range(alias: str, prefix: str) -> Q:
+    """
+    Prefix match on a lowercased annotation written as a range, so the
+    Lower() index behind it can be used
+    """
+    prefix = prefix.lower()
+    return Q(**{f"{alias}__gte": prefix, f"{alias}__lt": prefix + "\U0010ffff"})
+
+
+def search_reservations(
+    reservations: QuerySet,
+    query: str = "",
+    start: date | None = None,
+    end: date | None = None,
+) -> QuerySet:
+    """
+    Reservations whose code is `query`, or whose guest email address is
+    `query`, or whose guest first / last name starts with it ("first last"
+    matches both), and whose stay overlaps the days from start to end
+    """
+    query = " ".join(query.split())
+    if query:
+        customers = Customer.objects.annotate(
+            first=Lower("first_name"),
+            last=Lower("last_name"),
+            email=Lower("email_address"),
+        )
+        if "@" in query:
+            customers = customers.filter(email=query.lower())
+        else:
+            first, _, last = query.partition(" ")
+            customers = customers.filter(
+                prefix_range("first", first) & prefix_range("last", last)
+                if last
+                else prefix_range("first", first) | prefix_range("last", first)
+            )
+
+        reservations = reservations.filter(
+            Q(code=query.upper()) | Q(customer__in=customers.values("pk"))
+        )
+
+    if start:
+        reservations = reservations.filter(departure_date__gt=local_midnight(start))
+    if end:
+        reservations = reservations.filter(
+            arrival_date__lt=local_midnight(end + timedelta(days=1))
+        )
+
+    return reservations
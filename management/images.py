@@ -0,0 +1,178 @@
+"""
+Resized and WebP variants of the room category and add-on covers.
+
+The variants of a cover are stored next to it under the hash of its content
+(`rooms/teir-1.jpg` -> `rooms/variants/<hash>/thumb.webp`), so the same
+image is only ever processed once and a new upload never reuses stale
+variants. They are made on a background thread after the upload is
+committed, the `cover_hash` of the row is set once they all exist and the
+original cover is used until then.
+"""
+import hashlib
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+
+# name -> the longest side in pixels
+VARIANT_SIZES = {"thumb": 320, "medium": 960}
+
+# format -> (file extension, Pillow save options)
+VARIANT_FORMATS = {
+    "webp": ("webp", {"format": "WEBP", "quality": 80, "method": 6}),
+    "jpeg": ("jpg", {"format": "JPEG", "quality": 82, "optimize": True, "progressive": True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def content_hash(file) -> str:
+    digest = hashlib.sha256()
+    file.open("rb")
+    try:
+        for chunk in file.chunks():
+            digest.update(chunk)
+    finally:
+        file.close()
+    return digest.hexdigest()[:16]
+
+
+def variant_name(cover_name: str, cover_hash: str, size: str, image_format: str) -> str:
+    extension, _ = VARIANT_FORMATS[image_format]
+    return posixpath.join(
+        posixpath.dirname(cover_name), "variants", cover_hash, f"{size}.{extension}"
+    )
+
+
+def variant_urls(storage, cover_name: str, cover_hash: str) -> dict:
+    """{size: {format: url}} of the variants, empty until they are made"""
+    if not cover_name or not cover_hash:
+        return {}
+
+    return {
+        size: {
+            image_format: storage.url(
+                variant_name(cover_name, cover_hash, size, image_format)
+            )
+            for image_format in VARIANT_FORMATS
+        }
+        for size in VARIANT_SIZES
+    }
+
+
+def variant_url(instance, variant: str = "thumb.webp") -> str:
+    """
+    The url of a variant ("<size>.<format>") of the cover of a room category
+    or add-on, the url of the original while there are no variants
+    """
+    if not instance.cover:
+        return ""
+
+    size, _, image_format = variant.partition(".")
+    if instance.cover_hash and size in VARIANT_SIZES and image_format in VARIANT_FORMATS:
+        return instance.cover.storage.url(
+            variant_name(instance.cover.name, instance.cover_hash, size, image_format)
+        )
+    return instance.cover.url
+
+
+def render_variant(image: Image.Image, size: int, image_format: str) -> bytes:
+    resized = image.copy()
+    resized.thumbnail((size, size), Image.LANCZOS)
+    if image_format == "jpeg" and resized.mode not in ("RGB", "L"):
+        resized = resized.convert("RGB")
+
+    _, options = VARIANT_FORMATS[image_format]
+    output = BytesIO()
+    resized.save(output, **options)
+    return output.getvalue()
+
+
+def make_variants(cover) -> str:
+    """
+    Stores the missing variants of a cover file, returns its content hash.
+    Raises the Pillow errors of files that are not images
+    """
+    storage = cover.storage
+    cover_hash = content_hash(cover)
+
+    missing = [
+        (size, image_format)
+        for size in VARIANT_SIZES
+        for image_format in VARIANT_FORMATS
+        if not storage.exists(variant_name(cover.name, cover_hash, size, image_format))
+    ]
+    if not missing:
+        return cover_hash
+
+    cover.open("rb")
+    try:
+        image = ImageOps.exif_transpose(Image.open(cover))
+        image.load()
+    finally:
+        cover.close()
+
+    for size, image_format in missing:
+        storage.save(
+            variant_name(cover.name, cover_hash, size, image_format),
+            ContentFile(render_variant(image, VARIANT_SIZES[size], image_format)),
+        )
+    return cover_hash
+
+
+def update_cover_variants(model_label: str, pk) -> bool:
+    """
+    Makes the variants of the cover of a row and records its hash, returns
+    False if the row has no cover (or is gone)
+    """
+    from .cache import catalog_version
+
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).only("pk", "cover", "cover_hash").first()
+    if instance is None or not instance.cover:
+        return False
+
+    cover_hash = make_variants(instance.cover)
+    if cover_hash != instance.cover_hash:
+        # Only if the cover was not replaced meanwhile, update() sends no
+        # signals so the catalog version is bumped here
+        model.objects.filter(pk=pk, cover=instance.cover.name).update(
+            cover_hash=cover_hash
+        )
+        catalog_version.bump()
+    return True
+
+
+def _run(model_label: str, pk):
+    try:
+        update_cover_variants(model_label, pk)
+    except Exception:
+        logger.exception("Could not make the cover variants of %s %s", model_label, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule_cover_variants(instance):
+    """Makes the cover variants on a background thread once committed"""
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix="cover-variants"
+            )
+        executor = _executor
+
+    model_label = instance._meta.label
+    pk = instance.pk
+    transaction.on_commit(lambda: executor.submit(_run, model_label, pk))
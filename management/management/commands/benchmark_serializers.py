@@ -0,0 +1,176 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from management.fast_serializers import (
+    FastReservationSerializer,
+    FastRoomCategorySerializer,
+    FastRoomSerializer,
+    FastSecureReservationSerializer,
+)
+from management.models import Customer, Payment, Reservation, Room, RoomCategory
+from management.serializers import (
+    ReservationSerializer,
+    RoomCategorySerializer,
+    RoomSerializer,
+    SecureReservationSerializer,
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds rooms and reservations inside a transaction that is rolled "
+        "back, checks that the fast read serializers render exactly the same "
+        "JSON as the model serializers and times both"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        mismatches = []
+
+        try:
+            with transaction.atomic():
+                self.seed(options["rows"])
+                mismatches = self.compare()
+                raise Rollback()
+        except Rollback:
+            pass
+
+        if mismatches:
+            raise CommandError(f"Different output for: {', '.join(mismatches)}")
+
+        self.stdout.write(self.style.SUCCESS("Fast serializers match"))
+
+    def seed(self, rows: int):
+        self.stdout.write(f"Seeding {rows} reservations")
+
+        categories = RoomCategory.objects.bulk_create(
+            [
+                RoomCategory(
+                    title=f"Benchmark {i}",
+                    description="A quiet room " * 20,
+                    price=100.5 * (i + 1),
+                    cover="rooms/teir-1.jpg" if i % 2 else "",
+                )
+                for i in range(5)
+            ]
+        )
+        rooms = Room.objects.bulk_create(
+            [
+                Room(
+                    category=categories[i % 5],
+                    number=f"B{i}",
+                    addon={"bed": "king"} if i % 3 else {},
+                )
+                for i in range(200)
+            ]
+        )
+        customers = Customer.objects.bulk_create(
+            [
+                Customer(
+                    first_name=f"Guest{i}",
+                    last_name="Benchmark",
+                    id_type="national_id",
+                    id_number=f"{i:011d}",
+                    email_address=f"guest{i}@example.com",
+                    phone_number=f"080{i:08d}"[:12],
+                )
+                for i in range(rows)
+            ]
+        )
+        payments = Payment.objects.bulk_create(
+            [Payment(amount=100.0 * i, customer=customers[i]) for i in range(0, rows, 4)]
+        )
+
+        now = timezone.now()
+        reservations = []
+        for i in range(rows):
+            arrival = now + timedelta(days=random.randint(-300, 300), minutes=i)
+            reservations.append(
+                Reservation(
+                    room=rooms[i % len(rooms)],
+                    customer=customers[i] if i % 10 else None,
+                    code=f"BM{i}",
+                    reservation_type=Reservation.RESERVATION,
+                    arrival_date=arrival,
+                    departure_date=arrival + timedelta(days=2, hours=3),
+                    reservated_on=now,
+                    guests=[{"name": "Guest"}] if i % 2 else [],
+                    paid=i % 4 == 0,
+                    payment=payments[i // 4] if i % 4 == 0 else None,
+                    cancelled=i % 7 == 0,
+                    cancelled_on=now if i % 7 == 0 else None,
+                )
+            )
+        Reservation.objects.bulk_create(reservations, batch_size=2000)
+
+    def compare(self) -> list[str]:
+        reservations = Reservation.objects.order_by("pk")
+        cases = (
+            (
+                "reservations",
+                lambda: ReservationSerializer(
+                    reservations.select_related("room__category", "customer"),
+                    many=True,
+                ).data,
+                lambda: FastReservationSerializer().serialize(reservations),
+            ),
+            (
+                "secure reservations",
+                lambda: SecureReservationSerializer(
+                    reservations.select_related("room__category", "customer"),
+                    many=True,
+                ).data,
+                lambda: FastSecureReservationSerializer().serialize(reservations),
+            ),
+            (
+                "rooms",
+                lambda: RoomSerializer(
+                    Room.objects.select_related("category").order_by("pk"), many=True
+                ).data,
+                lambda: FastRoomSerializer().serialize(Room.objects.order_by("pk")),
+            ),
+            (
+                "categories",
+                lambda: RoomCategorySerializer(
+                    RoomCategory.objects.order_by("pk"), many=True
+                ).data,
+                lambda: FastRoomCategorySerializer().serialize(
+                    RoomCategory.objects.order_by("pk")
+                ),
+            ),
+        )
+
+        renderer = JSONRenderer()
+        mismatches = []
+        for name, model_serializer, fast_serializer in cases:
+            model_time, model_output = self.timed(model_serializer)
+            fast_time, fast_output = self.timed(fast_serializer)
+
+            same = renderer.render(model_output) == renderer.render(fast_output)
+            if not same:
+                mismatches.append(name)
+
+            self.stdout.write(
+                f"{'OK  ' if same else 'FAIL'} {name}: {len(fast_output)} rows, "
+                f"model {model_time * 1000:.0f} ms, fast {fast_time * 1000:.0f} ms "
+                f"({model_time / max(fast_time, 1e-9):.1f}x)"
+            )
+
+        return mismatches
+
+    def timed(self, function):
+        start = time.perf_counter()
+        output = function()
+        return time.perf_counter() - start, output
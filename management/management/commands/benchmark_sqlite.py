@@ -0,0 +1,204 @@
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from management.managers import MAX_BOOKING_ATTEMPTS
+from management.sqlite import PRODUCTION_PRAGMAS, pragma_statements
+
+
+# name -> (sqlite3 timeout in seconds, pragmas), as set up by the
+# DATABASE_PROFILE setting
+PROFILES = {
+    "default": (5, {}),
+    "production": (20, PRODUCTION_PRAGMAS),
+}
+
+SCHEMA = """
+CREATE TABLE reservation (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    room_id INTEGER NOT NULL,
+    arrival INTEGER NOT NULL,
+    departure INTEGER NOT NULL,
+    requirement TEXT NOT NULL,
+    viewed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX reservation_room_stay_idx ON reservation (room_id, arrival, departure);
+CREATE INDEX reservation_stay_idx ON reservation (departure, arrival);
+"""
+
+ROOMS = 200
+DAYS = 365
+
+# Free rooms of a stay, like the availability endpoints
+AVAILABILITY_QUERY = """
+SELECT COUNT(*) FROM (
+    SELECT DISTINCT room_id FROM reservation
+    WHERE departure > ? AND arrival < ?
+)
+"""
+# A page of the admin reservation list
+PAGE_QUERY = "SELECT * FROM reservation ORDER BY id DESC LIMIT 25 OFFSET ?"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures SQLite read throughput while bookings are written, with "
+        "Django's default connection settings and with the production "
+        "database profile (see DATABASE_PROFILE), on a temporary database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--rows", type=int, default=50_000)
+        parser.add_argument(
+            "--profile", choices=list(PROFILES), action="append", dest="profiles"
+        )
+
+    def handle(self, *args, **options):
+        for name in options["profiles"] or list(PROFILES):
+            with tempfile.TemporaryDirectory() as directory:
+                path = Path(directory) / "benchmark.sqlite3"
+                self.seed(path, options["rows"])
+                result = self.run(
+                    path,
+                    PROFILES[name],
+                    options["seconds"],
+                    options["readers"],
+                    options["writers"],
+                )
+            self.report(name, result, options["seconds"])
+
+    def connect(self, path: Path, profile) -> sqlite3.Connection:
+        timeout, pragmas = profile
+        # Transactions are opened explicitly, as Django does
+        connection = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None, check_same_thread=False
+        )
+        for statement in pragma_statements(pragmas):
+            connection.execute(statement)
+        return connection
+
+    def seed(self, path: Path, rows: int):
+        connection = sqlite3.connect(path, isolation_level=None)
+        connection.executescript(SCHEMA)
+        connection.execute("BEGIN")
+        connection.executemany(
+            "INSERT INTO reservation (room_id, arrival, departure, requirement) "
+            "VALUES (?, ?, ?, ?)",
+            (self.stay() + ("A quiet room " * 10,) for _ in range(rows)),
+        )
+        connection.execute("COMMIT")
+        connection.close()
+
+    def stay(self) -> tuple[int, int, int]:
+        arrival = random.randrange(DAYS)
+        return random.randrange(ROOMS), arrival, arrival + random.randint(1, 7)
+
+    def run(self, path: Path, profile, seconds: float, readers: int, writers: int):
+        stop = threading.Event()
+        lock = threading.Lock()
+        result = {
+            "reads": 0,
+            "read_errors": 0,
+            "writes": 0,
+            "retries": 0,
+            "write_errors": 0,
+            "latencies": [],
+        }
+
+        def record(**counts):
+            with lock:
+                for key, value in counts.items():
+                    if key == "latencies":
+                        result[key].extend(value)
+                    else:
+                        result[key] += value
+
+        def read():
+            connection = self.connect(path, profile)
+            reads, errors, latencies = 0, 0, []
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    if reads % 2:
+                        first = random.randrange(DAYS)
+                        connection.execute(
+                            AVAILABILITY_QUERY, (first, first + 3)
+                        ).fetchone()
+                    else:
+                        connection.execute(
+                            PAGE_QUERY, (random.randrange(20) * 25,)
+                        ).fetchall()
+                except sqlite3.OperationalError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                reads += 1
+            connection.close()
+            record(reads=reads, read_errors=errors, latencies=latencies)
+
+        def write():
+            connection = self.connect(path, profile)
+            writes, retries, errors = 0, 0, 0
+            while not stop.is_set():
+                room, arrival, departure = self.stay()
+                # Like RoomManager.book_room, the overlap check then the
+                # insert in one (deferred) transaction, retried while the
+                # database is locked
+                for attempt in range(MAX_BOOKING_ATTEMPTS):
+                    try:
+                        connection.execute("BEGIN")
+                        connection.execute(
+                            "SELECT 1 FROM reservation WHERE room_id = ? "
+                            "AND arrival < ? AND departure > ? LIMIT 1",
+                            (room, departure, arrival),
+                        ).fetchone()
+                        connection.execute(
+                            "INSERT INTO reservation (room_id, arrival, departure, "
+                            "requirement) VALUES (?, ?, ?, ?)",
+                            (room, arrival, departure, "Benchmark booking"),
+                        )
+                        connection.execute("COMMIT")
+                        writes += 1
+                        break
+                    except sqlite3.OperationalError:
+                        if connection.in_transaction:
+                            connection.execute("ROLLBACK")
+                        if attempt == MAX_BOOKING_ATTEMPTS - 1:
+                            errors += 1
+                        else:
+                            retries += 1
+                            time.sleep(random.uniform(0, 0.01 * 2**attempt))
+            connection.close()
+            record(writes=writes, retries=retries, write_errors=errors)
+
+        threads = [threading.Thread(target=write) for _ in range(writers)]
+        threads += [threading.Thread(target=read) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return result
+
+    def report(self, name: str, result: dict, seconds: float):
+        latencies = sorted(result["latencies"]) or [0]
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+
+        self.stdout.write(
+            f"{name:<10} reads {result['reads'] / seconds:8.0f}/s "
+            f"(p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms), "
+            f"writes {result['writes'] / seconds:6.0f}/s "
+            f"({result['retries']} retried), "
+            f"locked: {result['read_errors']} reads, "
+            f"{result['write_errors']} bookings"
+        )
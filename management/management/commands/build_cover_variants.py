@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from management.images import update_cover_variants
+from management.models import AddOn, RoomCategory
+
+
+class Command(BaseCommand):
+    help = (
+        "Makes the missing resized and WebP variants of every room category "
+        "and add-on cover, covers that already have them are only hashed"
+    )
+
+    def handle(self, *args, **options):
+        for model in (RoomCategory, AddOn):
+            done = failed = 0
+            for pk in model.objects.exclude(cover="").values_list("pk", flat=True):
+                try:
+                    update_cover_variants(model._meta.label, pk)
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {pk}: {e}")
+
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}: {done} covers, {failed} failed"
+            )
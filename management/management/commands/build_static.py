@@ -0,0 +1,65 @@
+import shutil
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from management import assets
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds STATIC_ROOT into STATIC_BUILD_ROOT: content hashed copies of "
+        "every file and gzip/brotli variants of the compressible ones, served "
+        "by management.assets.serve_asset"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete the previous build first",
+        )
+        parser.add_argument("--workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        source_root = Path(settings.STATIC_ROOT)
+        target_root = Path(settings.STATIC_BUILD_ROOT)
+
+        if not source_root.is_dir():
+            raise CommandError(f"{source_root} is not a directory")
+        if target_root.resolve() == source_root.resolve():
+            raise CommandError("STATIC_BUILD_ROOT must differ from STATIC_ROOT")
+
+        if options["clear"] and target_root.exists():
+            shutil.rmtree(target_root)
+        target_root.mkdir(parents=True, exist_ok=True)
+
+        if assets.brotli is None:
+            self.stdout.write(
+                self.style.WARNING("brotli is not installed, only gzip variants are built")
+            )
+
+        start = time.perf_counter()
+        manifest = assets.build(source_root, target_root, options["workers"])
+        elapsed = time.perf_counter() - start
+
+        files = manifest["files"].values()
+        size = sum(entry["size"] for entry in files)
+        compressed = [entry for entry in files if entry["encodings"]]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Built {len(files)} files ({size / 1e6:.1f} MB) in {elapsed:.1f}s, "
+                f"{len(compressed)} with precompressed variants"
+            )
+        )
+
+        for encoding in assets.ENCODINGS:
+            entries = [entry for entry in files if encoding in entry["encodings"]]
+            if entries:
+                original = sum(entry["size"] for entry in entries)
+                encoded = sum(entry["encodings"][encoding] for entry in entries)
+                self.stdout.write(
+                    f"  {encoding}: {original / 1e6:.1f} MB -> {encoded / 1e6:.1f} MB"
+                )
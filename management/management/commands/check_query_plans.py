@@ -0,0 +1,137 @@
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from management.availability import stay_nights
+from management.managers import RoomManager, RoomNightLedger
+from management.models import Reservation, Room, RoomCategory, RoomNight
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a large set of rooms, reservations and their ledger nights "
+        "inside a transaction that is rolled back, and checks that the "
+        "database planner uses the indexes of the availability, code and "
+        "unviewed queries"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=500)
+        parser.add_argument("--reservations", type=int, default=100_000)
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        failures = []
+
+        try:
+            with transaction.atomic():
+                self.seed(options["rooms"], options["reservations"])
+                failures = self.check_plans()
+                raise Rollback()
+        except Rollback:
+            pass
+
+        if failures:
+            raise CommandError(
+                f"The planner did not use: {', '.join(sorted(failures))}"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Every query uses its index"))
+
+    def seed(self, room_count: int, reservation_count: int):
+        self.stdout.write(
+            f"Seeding {room_count} rooms and {reservation_count} reservations"
+        )
+
+        category = RoomCategory.objects.create(title="Query plan check", price=0)
+        rooms = Room.objects.bulk_create(
+            [Room(category=category, number=f"QP{i}") for i in range(room_count)]
+        )
+
+        now = timezone.now()
+        reservations = []
+        for i in range(reservation_count):
+            arrival = now + timedelta(days=random.randint(-720, 360))
+            reservations.append(
+                Reservation(
+                    room=random.choice(rooms),
+                    arrival_date=arrival,
+                    departure_date=arrival + timedelta(days=random.randint(1, 7)),
+                    reservated_on=now,
+                    code=f"QP{i}",
+                    viewed=random.random() > 0.01,
+                    cancelled=random.random() < 0.05,
+                    reservation_type=Reservation.RESERVATION,
+                )
+            )
+        Reservation.objects.bulk_create(reservations, batch_size=2000)
+
+        # bulk_create skips Reservation.save, the ledger nights are written
+        # here (the random stays can overlap, a night is kept for the first)
+        nights = {}
+        for reservation in reservations:
+            for night in RoomNight.expected_nights(reservation):
+                nights.setdefault((night.room_id, night.night), night)
+        RoomNight.objects.bulk_create(nights.values(), batch_size=2000)
+
+        if connection.vendor in ("sqlite", "postgresql"):
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
+
+    def check_plans(self) -> list[str]:
+        start = timezone.now() + timedelta(days=30)
+        end = start + timedelta(days=3)
+        overlapping = RoomManager.overlapping_reservations(start, end)
+        first_night, end_night = stay_nights(start, end)
+        room = Room.objects.order_by("pk").first()
+
+        # The unique indexes are named by the database (SQLite names the
+        # index of a unique constraint sqlite_autoindex_<table>_<n>)
+        ledger_indexes = (
+            "room_night_unique",
+            "room_night_night_idx",
+            "sqlite_autoindex_management_roomnight",
+        )
+        queries = {
+            "ledger free rooms": (
+                RoomNightLedger.free_rooms(None, first_night, end_night),
+                ledger_indexes,
+            ),
+            "ledger taken nights": (
+                RoomNightLedger.taken_nights(room.pk, first_night, end_night),
+                ledger_indexes,
+            ),
+            # Both indexes lead with the departure date, the planner picks
+            # either for the overlap across every room
+            "reservation_stay_idx": (
+                overlapping,
+                ("reservation_stay_idx", "reservation_departure_idx"),
+            ),
+            "reservation code index": (
+                Reservation.objects.filter(code="QP42"),
+                ("sqlite_autoindex_management_reservation", "reservation_code"),
+            ),
+            "reservation_unviewed_idx": (
+                Reservation.objects.filter(viewed=False),
+                ("reservation_unviewed_idx",),
+            ),
+        }
+
+        failures = []
+        for name, (queryset, indexes) in queries.items():
+            plan = queryset.explain()
+            used = any(index in plan for index in indexes)
+            self.stdout.write(f"{'OK  ' if used else 'FAIL'} {name}")
+            if self.verbosity > 1:
+                self.stdout.write(plan)
+            if not used:
+                failures.append(name)
+
+        return failures
@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from management.exports import EXPORT_FORMATS, export_lines
+from management.filters import DATE_FILTERS, BOOLEAN_FILTERS, FilterError, filter_reservations
+from management.models import Reservation
+
+
+class Command(BaseCommand):
+    help = "Streams the reservations with their customer, room and payment as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=tuple(EXPORT_FORMATS), default="ndjson")
+        parser.add_argument(
+            "--file", help="Where to write the export, defaults to the standard output"
+        )
+        for name in (*DATE_FILTERS, *BOOLEAN_FILTERS, "category"):
+            parser.add_argument(f"--{name.replace('_', '-')}", dest=name)
+
+    def handle(self, *args, **options):
+        params = {
+            name: options[name]
+            for name in (*DATE_FILTERS, *BOOLEAN_FILTERS, "category")
+            if options[name]
+        }
+
+        try:
+            reservations = filter_reservations(Reservation.objects.all(), params)
+        except FilterError as e:
+            raise CommandError(str(e))
+
+        output = open(options["file"], "w", newline="") if options["file"] else sys.stdout
+        try:
+            for line in export_lines(reservations, options["format"]):
+                output.write(line)
+        finally:
+            if options["file"]:
+                output.close()
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from management.managers import DailyStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the daily room category stats of a date range from the "
+        "reservation ledger (defaults to the past year and the next 90 days)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day (YYYY-MM-DD)")
+        parser.add_argument("--end", help="Last day, included (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        start = self.parse(options["start"]) or today - timedelta(days=365)
+        end = self.parse(options["end"]) or today + timedelta(days=90)
+        if end < start:
+            raise CommandError("--end should not be before --start")
+
+        written = 0
+        # A month at a time, the ledger rows of a month are grouped at once
+        while start <= end:
+            chunk_end = min(start + timedelta(days=31), end + timedelta(days=1))
+            written += DailyStats.refresh(start, chunk_end)
+            start = chunk_end
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} daily stats rows"))
+
+    def parse(self, value):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date '{value}', use YYYY-MM-DD")
+        return day
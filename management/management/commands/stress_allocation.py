@@ -0,0 +1,119 @@
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.utils import timezone
+
+from management.managers import RoomManager
+from management.models import Customer, Reservation, Room, RoomCategory
+
+
+class Command(BaseCommand):
+    help = (
+        "Books the rooms of a temporary category from many threads at once "
+        "and checks that no room was booked twice for the same dates, the "
+        "temporary category, rooms, reservations and customers are deleted "
+        "afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=5)
+        parser.add_argument("--threads", type=int, default=32)
+        parser.add_argument("--bookings", type=int, default=4)
+
+    def handle(self, *args, **options):
+        category = RoomCategory.objects.create(title="Allocation stress", price=0)
+        Room.objects.bulk_create(
+            [Room(category=category, number=f"S{i}") for i in range(options["rooms"])]
+        )
+
+        try:
+            results = self.run_threads(
+                category, options["threads"], options["bookings"]
+            )
+            double_bookings = self.count_double_bookings(category)
+        finally:
+            Customer.objects.filter(reservations__room__category=category).delete()
+            category.delete()
+
+        self.stdout.write(
+            ", ".join(f"{outcome}: {count}" for outcome, count in sorted(results.items()))
+        )
+
+        if results["booked"] > options["rooms"]:
+            raise CommandError(
+                f"{results['booked']} bookings succeeded for {options['rooms']} rooms"
+            )
+        if double_bookings:
+            raise CommandError(f"{double_bookings} rooms were booked twice")
+
+        self.stdout.write(self.style.SUCCESS("No double booking"))
+
+    def run_threads(self, category: RoomCategory, threads: int, bookings: int):
+        arrival = timezone.now() + timedelta(days=30)
+        departure = arrival + timedelta(days=2)
+        results = Counter()
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads)
+
+        def book(worker: int):
+            barrier.wait()
+            try:
+                for i in range(bookings):
+                    reservation = Reservation(
+                        customer=Customer(
+                            first_name="Stress",
+                            last_name=f"{worker}-{i}",
+                            id_type="test",
+                            id_number="0000000",
+                            email_address="stress@example.com",
+                            phone_number="0000000",
+                        ),
+                        reservation_type=Reservation.RESERVATION,
+                        arrival_date=arrival,
+                        departure_date=departure,
+                        reservated_on=timezone.now(),
+                    )
+                    try:
+                        outcome = (
+                            "booked"
+                            if RoomManager.allocate_room(category, reservation)
+                            else "sold out"
+                        )
+                    except OperationalError:
+                        outcome = "database busy"
+
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connections.close_all()
+
+        workers = [
+            threading.Thread(target=book, args=(worker,)) for worker in range(threads)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        return results
+
+    def count_double_bookings(self, category: RoomCategory) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT COUNT(DISTINCT a.room_id)
+                FROM management_reservation a
+                JOIN management_reservation b
+                    ON a.room_id = b.room_id AND a.id < b.id
+                JOIN management_room r ON r.id = a.room_id
+                WHERE r.category_id = %s
+                    AND NOT a.cancelled AND NOT b.cancelled
+                    AND a.arrival_date < b.departure_date
+                    AND b.arrival_date < a.departure_date
+                """,
+                [category.pk],
+            )
+            return cursor.fetchone()[0]
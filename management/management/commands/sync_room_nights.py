@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from management.managers import RoomNightLedger
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfills the room night ledger from the active reservations and "
+        "removes stale nights, with --verify it only reports the differences"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only check that the ledger matches the reservations",
+        )
+
+    def handle(self, *args, **options):
+        verify = options["verify"]
+        result = RoomNightLedger.sync(fix=not verify)
+
+        self.stdout.write(
+            f"Missing nights: {result['missing']}, stale nights: {result['stale']}, "
+            f"double booked nights: {result['conflicts']}"
+        )
+
+        if verify and (result["missing"] or result["stale"]):
+            raise CommandError("The room night ledger does not match the reservations")
+
+        if result["conflicts"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    "Some nights are booked by more than one reservation, "
+                    "they are kept for the oldest reservation"
+                )
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS("Ledger verified" if verify else "Ledger synced")
+        )
@@ -1,77 +1,625 @@
-from .models import Room, RoomCategory, Reservation
+from .models import (
+    DailyCategoryStats,
+    Payment,
+    Room,
+    RoomCategory,
+    RoomNight,
+    Reservation,
+    Sequence,
+)
+from .availability import aware, stay_nights
+from .cache import (
+    availability_cache,
+    catalog_version,
+    dashboard_counters,
+)
 from django.utils.datetime_safe import datetime
-from django.db.models import Q, QuerySet
+from django.db import IntegrityError, OperationalError, transaction
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    F,
+    FloatField,
+    OuterRef,
+    QuerySet,
+    Subquery,
+    Sum,
+    When,
+)
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+import logging
+import random
+import time
+from datetime import date, time as dt_time, timedelta
+
+
+logger = logging.getLogger(__name__)
+
+# How many times a booking is retried when the database is locked by a
+# concurrent booking (SQLite) before giving up
+MAX_BOOKING_ATTEMPTS = 8
+
+# The most rooms provisioned at once
+MAX_PROVISIONED_ROOMS = 1000
 
 
 class RoomManager:
+    @staticmethod
+    def overlapping_reservations(start_date: datetime, end_date: datetime):
+        """
+        Reservations that are still active (not cancelled) and whose stay
+        overlaps the half-open window [start_date, end_date), a guest leaving
+        at start_date does not block a guest arriving at start_date
+        """
+        return Reservation.objects.filter(
+            cancelled=False,
+            arrival_date__lt=end_date,
+            departure_date__gt=start_date,
+        )
+
     @staticmethod
     def available_rooms(
         category: RoomCategory, start_date: datetime, end_date: datetime
     ):
-        reservations = Reservation.objects.filter(
-            Q(arrival_date=start_date)
-            | Q(departure_date=start_date)
-            | Q(departure_date=start_date)
-            | Q(departure_date=end_date)
-            | Q(arrival_date__gte=start_date) & Q(departure_date__lte=end_date)
-            | Q(arrival_date__lte=start_date) & Q(departure_date__gte=start_date)
-            | Q(arrival_date__lte=end_date) & Q(departure_date__gte=end_date)
-            | Q(arrival_date__lte=start_date) & Q(departure_date__gte=end_date)
+        """
+        Returns the rooms (optionally limited to a category) that are free
+        on every night of the start and end date (see query_free_rooms).
+        The ids of the free rooms are served from the availability cache when
+        the window was already asked for and nothing changed since
+        """
+        room_ids = availability_cache.get_or_compute(
+            category.pk if category else None,
+            start_date,
+            end_date,
+            lambda: list(
+                RoomManager.query_free_rooms(
+                    category, start_date, end_date
+                ).values_list("pk", flat=True)
+            ),
         )
-        # Get reservations that falls within the start and end date
 
-        # Get all the rooms under that category and remove each room of each reservation
-        # rooms: QuerySet = category.rooms
+        return Room.objects.select_related("category").filter(pk__in=room_ids)
 
-        rooms = Room.objects.all()
-        if category:
-            rooms = Room.objects.filter(category=category)
+    @staticmethod
+    def query_free_rooms(
+        category: RoomCategory, start_date: datetime, end_date: datetime
+    ):
+        """
+        Uncached availability resolved by the database in a single query using
+        a NOT EXISTS anti-join on the nights ledger. A room is free when none
+        of the nights of the stay (see availability.stay_nights) is taken,
+        the rule the ledger constraint enforces when the room is booked
+        """
+        return RoomNightLedger.free_rooms(
+            category, *stay_nights(start_date, end_date)
+        )
+
+    @staticmethod
+    def book_room(room_id: int, reservation: Reservation) -> bool:
+        """
+        Saves the (unsaved) reservation, and its unsaved customer, into the
+        room if the room is still free for the reservation dates.
+        The room row is locked inside the transaction (SELECT ... FOR UPDATE,
+        SQLite serializes the writers instead) and the nights are checked
+        again against the ledger before saving.
+        Returns False if the room is taken
+        """
+        customer = reservation.customer
+
+        for attempt in range(MAX_BOOKING_ATTEMPTS):
+            customer_created = customer is not None and customer.pk is None
+            committed = []
+            try:
+                with transaction.atomic():
+                    # Runs first of the commit hooks, an error raised by a
+                    # later hook happens once the booking is committed
+                    transaction.on_commit(lambda: committed.append(True))
+
+                    room = Room.objects.select_for_update().filter(pk=room_id).first()
+                    if room is None or RoomNightLedger.is_taken(
+                        room_id,
+                        *stay_nights(reservation.arrival_date, reservation.departure_date),
+                    ):
+                        return False
+
+                    if customer_created:
+                        customer.save()
+                    reservation.room = room
+                    reservation.save()
+                    return True
+
+            except (IntegrityError, OperationalError) as error:
+                if committed:
+                    # The booking is saved, it must neither be undone nor
+                    # made again in another room
+                    logger.exception(
+                        "A commit hook of reservation %s failed", reservation.pk
+                    )
+                    return True
+
+                # The transaction was rolled back so nothing was saved
+                RoomManager._unsave(reservation, customer if customer_created else None)
+
+                if isinstance(error, IntegrityError):
+                    # A night of the room was taken by a concurrent booking,
+                    # the ledger constraint rejected it
+                    return False
+
+                # The database is locked by a concurrent booking
+                if attempt == MAX_BOOKING_ATTEMPTS - 1:
+                    raise
+                time.sleep(random.uniform(0, 0.01 * 2**attempt))
+
+        return False
+
+    @staticmethod
+    def _unsave(*instances):
+        """Marks instances saved in a rolled back transaction as unsaved"""
+        for instance in instances:
+            if instance is not None:
+                instance.pk = None
+                instance._state.adding = True
 
-        for reservation in reservations:
-            rooms = rooms.exclude(pk=reservation.room.pk)
+    @staticmethod
+    def allocate_room(category: RoomCategory, reservation: Reservation) -> bool:
+        """
+        Books the first room of the category that is free for the (unsaved)
+        reservation dates, a room taken by a concurrent booking meanwhile is
+        skipped and the next free room is tried.
+        Returns False if the category is sold out for those dates
+        """
+        tried = set()
+
+        while True:
+            # The candidates are read from the database, the cache and the
+            # index may not have seen a booking made by another worker yet
+            room_ids = list(
+                RoomManager.query_free_rooms(
+                    category, reservation.arrival_date, reservation.departure_date
+                )
+                .exclude(pk__in=tried)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:10]
+            )
+            if not room_ids:
+                return False
+
+            for room_id in room_ids:
+                if RoomManager.book_room(room_id, reservation):
+                    return True
+                tried.add(room_id)
+
+    @staticmethod
+    def provision_rooms(category: RoomCategory, count: int) -> list[Room]:
+        """
+        Creates `count` rooms in the category with one bulk insert, their
+        numbers are the next block of the room number sequence so concurrent
+        provisioning never hands out the same number twice.
+        bulk_create sends no signals, the caches and counters they maintain
+        are updated here
+        """
+        if count < 1 or count > MAX_PROVISIONED_ROOMS:
+            raise ValueError(
+                f"The number of rooms should be between 1 and {MAX_PROVISIONED_ROOMS}"
+            )
+
+        with transaction.atomic():
+            first = Sequence.next_block(
+                "room_number", count, initial=RoomManager.highest_room_number
+            )
+            rooms = Room.objects.bulk_create(
+                [
+                    Room(category=category, number=str(first + i))
+                    for i in range(count)
+                ],
+                batch_size=500,
+            )
+
+            dashboard_counters.add("rooms", count)
+
+            category_id = category.pk
+
+            def provisioned():
+                availability_cache.invalidate_rooms()
+                catalog_version.bump()
+                DailyStats.refresh_inventory(category_id)
+
+            transaction.on_commit(provisioned, robust=True)
 
-        # return the remaining rooms
         return rooms
 
     @staticmethod
-    def extract_categories(rooms: list[Room]) -> list[RoomCategory]:
+    def highest_room_number() -> int:
+        """The highest numeric room number, 0 if there is none"""
+        return max(
+            (
+                int(number)
+                for number in Room.objects.values_list("number", flat=True).iterator()
+                if number.isdigit()
+            ),
+            default=0,
+        )
+
+    @staticmethod
+    def batch_available_rooms(
+        stays: list[tuple[int | None, datetime, datetime]]
+    ) -> list[list[int]]:
+        """
+        Answers many (category id or None, start date, end date) availability
+        checks at once, the rooms and the ledger nights of the union of all
+        the stays are fetched a single time.
+        Returns the ids of the free rooms of each stay, in the same order
+        """
+        if not stays:
+            return []
+
+        stay_ranges = [
+            stay_nights(start_date, end_date) for _, start_date, end_date in stays
+        ]
+        union_first = min(first for first, _ in stay_ranges)
+        union_end = max(end for _, end in stay_ranges)
+
+        rooms = list(Room.objects.order_by("pk").values_list("pk", "category_id"))
+
+        taken: dict[int, set[date]] = {}
+        for room_id, night in (
+            RoomNight.objects.filter(night__gte=union_first, night__lt=union_end)
+            .values_list("room_id", "night")
+            .iterator()
+        ):
+            taken.setdefault(room_id, set()).add(night)
+
+        results = []
+        for (category_id, _, _), (first, end) in zip(stays, stay_ranges):
+            nights = {first + timedelta(days=i) for i in range((end - first).days)}
+            results.append(
+                [
+                    room_id
+                    for room_id, room_category_id in rooms
+                    if (category_id is None or room_category_id == category_id)
+                    and nights.isdisjoint(taken.get(room_id, ()))
+                ]
+            )
+
+        return results
+
+    @staticmethod
+    def extract_categories(rooms: QuerySet | list[Room]) -> list[RoomCategory]:
+        """
+        Returns the distinct categories of the rooms, a queryset of rooms is
+        resolved with a single query on the categories table
+        """
+        if isinstance(rooms, QuerySet):
+            return list(
+                RoomCategory.objects.filter(
+                    pk__in=rooms.values("category_id")
+                ).order_by("pk")
+            )
+
         categories = []
         categories_id = set()
 
         for room in rooms:
-            if room.category.pk not in categories_id:
+            if room.category_id not in categories_id:
                 categories.append(room.category)
-                categories_id.add(room.category.pk)
+                categories_id.add(room.category_id)
 
         return categories
 
+    @staticmethod
+    def taken_rooms(start_date: datetime, end_date: datetime):
+        """
+        Returns the rooms that have a ledger night between the start and end
+        date, the rooms query_free_rooms leaves out
+        """
+        return RoomNightLedger.taken_rooms(*stay_nights(start_date, end_date))
+
+
+class ReservationManager:
+    @staticmethod
+    def mark_viewed(reservation: Reservation) -> bool:
+        """
+        Marks the reservation as viewed with a conditional update of that
+        column only, nothing is written if it already was.
+        Returns True if the reservation was new
+        """
+        if reservation.viewed:
+            return False
+
+        with transaction.atomic():
+            updated = Reservation.objects.filter(
+                pk=reservation.pk, viewed=False
+            ).update(viewed=True)
+            # update() sends no signals
+            if updated:
+                dashboard_counters.add("new_reservations", -updated)
+
+        reservation.viewed = True
+        reservation._loaded_viewed = True
+        return bool(updated)
+
+    @staticmethod
+    def mark_all_viewed() -> int:
+        """Marks every new reservation as viewed, returns how many were"""
+        with transaction.atomic():
+            updated = Reservation.objects.filter(viewed=False).update(viewed=True)
+            if updated:
+                dashboard_counters.add("new_reservations", -updated)
+        return updated
+
+
+class RoomNightLedger:
+    @staticmethod
+    def free_rooms(category: RoomCategory, first_night: date, end_night: date):
+        """The rooms with no ledger night from first_night up to end_night"""
+        rooms: QuerySet = Room.objects.select_related("category")
+        if category:
+            rooms = rooms.filter(category=category)
+
+        nights = RoomNight.objects.filter(
+            room=OuterRef("pk"), night__gte=first_night, night__lt=end_night
+        )
+        return rooms.filter(~Exists(nights))
+
+    @staticmethod
+    def taken_rooms(first_night: date, end_night: date):
+        """The rooms with a ledger night from first_night up to end_night"""
+        nights = RoomNight.objects.filter(
+            room=OuterRef("pk"), night__gte=first_night, night__lt=end_night
+        )
+        return Room.objects.select_related("category").filter(Exists(nights))
+
+    @staticmethod
+    def taken_nights(room_id: int, first_night: date, end_night: date) -> QuerySet:
+        """The ledger nights of the room from first_night up to end_night"""
+        return RoomNight.objects.filter(
+            room_id=room_id, night__gte=first_night, night__lt=end_night
+        )
+
+    @staticmethod
+    def is_taken(room_id: int, first_night: date, end_night: date) -> bool:
+        return RoomNightLedger.taken_nights(room_id, first_night, end_night).exists()
+
+    @staticmethod
+    def sync(fix: bool = True) -> dict[str, int]:
+        """
+        Compares the ledger with the nights of the active reservations and,
+        when fix is set, inserts the missing nights and deletes the stale
+        ones. A night claimed by more than one reservation (a double booking
+        made before the ledger existed) is kept for the oldest reservation
+        and reported as a conflict.
+        Returns the counts of missing, stale and conflicting nights
+        """
+        claimants: dict[tuple[int, date], list[RoomNight]] = {}
+        for reservation in (
+            Reservation.objects.filter(cancelled=False)
+            .order_by("pk")
+            .only("pk", "room_id", "arrival_date", "departure_date", "cancelled")
+            .iterator(chunk_size=2000)
+        ):
+            for night in RoomNight.expected_nights(reservation):
+                claimants.setdefault((night.room_id, night.night), []).append(night)
+
+        owners = {}
+        stale = []
+        for pk, room_id, night, reservation_id in RoomNight.objects.values_list(
+            "pk", "room_id", "night", "reservation_id"
+        ).iterator(chunk_size=2000):
+            key = (room_id, night)
+            if any(n.reservation_id == reservation_id for n in claimants.get(key, [])):
+                owners[key] = reservation_id
+            else:
+                stale.append(pk)
+
+        missing = [
+            nights[0] for key, nights in claimants.items() if key not in owners
+        ]
+        conflicts = sum(len(nights) - 1 for nights in claimants.values())
+
+        if fix:
+            with transaction.atomic():
+                for i in range(0, len(stale), 500):
+                    RoomNight.objects.filter(pk__in=stale[i : i + 500]).delete()
+                RoomNight.objects.bulk_create(missing, batch_size=2000)
+
+        return {
+            "missing": len(missing),
+            "stale": len(stale),
+            "conflicts": conflicts,
+        }
+
 
+class DailyStats:
     @staticmethod
-    def taken_rooms(start_date: datetime, end_date: datetime
+    def night_revenue():
+        """
+        The revenue of a ledger night: the successful payment of its
+        reservation spread over the reservation nights, or the nightly price
+        of the category when there is none
+        """
+        reservation_nights = (
+            RoomNight.objects.filter(reservation=OuterRef("reservation"))
+            .values("reservation")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return Case(
+            When(
+                reservation__payment__status=Payment.SUCCESS,
+                then=F("reservation__payment__amount") / Subquery(reservation_nights),
+            ),
+            default=F("room__category__price"),
+            output_field=FloatField(),
+        )
+
+    @staticmethod
+    def refresh(first_date: date, end_date: date) -> int:
+        """
+        Recomputes the stats of every category for the days from first_date
+        up to (not including) end_date, returns the number of rows written
+        """
+        if first_date >= end_date:
+            return 0
+
+        categories = list(RoomCategory.objects.values_list("pk", flat=True))
+        rooms = dict(
+            Room.objects.values("category")
+            .annotate(count=Count("pk"))
+            .values_list("category", "count")
+        )
+
+        sold = {
+            (night, category_id): (count, revenue)
+            for night, category_id, count, revenue in RoomNight.objects.filter(
+                night__gte=first_date, night__lt=end_date
+            )
+            .values("night", "room__category")
+            .annotate(count=Count("pk"), revenue=Sum(DailyStats.night_revenue()))
+            .values_list("night", "room__category", "count", "revenue")
+        }
+
+        cancellations = {
+            (day, category_id): count
+            for day, category_id, count in Reservation.objects.filter(
+                cancelled=True,
+                cancelled_on__gte=local_midnight(first_date),
+                cancelled_on__lt=local_midnight(end_date),
+            )
+            .annotate(day=TruncDate("cancelled_on"))
+            .values("day", "room__category")
+            .annotate(count=Count("pk"))
+            .values_list("day", "room__category", "count")
+        }
+
+        rows = []
+        for i in range((end_date - first_date).days):
+            day = first_date + timedelta(days=i)
+            for category_id in categories:
+                rooms_sold, revenue = sold.get((day, category_id), (0, 0.0))
+                rows.append(
+                    DailyCategoryStats(
+                        category_id=category_id,
+                        date=day,
+                        rooms_sold=rooms_sold,
+                        rooms_available=rooms.get(category_id, 0),
+                        revenue=revenue or 0.0,
+                        cancellations=cancellations.get((day, category_id), 0),
+                    )
+                )
+
+        DailyCategoryStats.objects.bulk_create(
+            rows,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["category", "date"],
+            update_fields=["rooms_sold", "rooms_available", "revenue", "cancellations"],
+        )
+        return len(rows)
+
+    @staticmethod
+    def refresh_reservation(
+        stays: list[tuple[datetime, datetime]], cancellations: list[datetime | None]
     ):
-        reservations = Reservation.objects.filter(
-            Q(arrival_date=start_date)
-            | Q(departure_date=start_date)
-            | Q(departure_date=start_date)
-            | Q(departure_date=end_date)
-            | Q(arrival_date__gte=start_date) & Q(departure_date__lte=end_date)
-            | Q(arrival_date__lte=start_date) & Q(departure_date__gte=start_date)
-            | Q(arrival_date__lte=end_date) & Q(departure_date__gte=end_date)
-            | Q(arrival_date__lte=start_date) & Q(departure_date__gte=end_date)
+        """
+        Recomputes the days a reservation change can affect, the nights of its
+        current and previous stays and its current and previous cancellation
+        days
+        """
+        for arrival_date, departure_date in stays:
+            if arrival_date and departure_date:
+                DailyStats.refresh(*stay_nights(arrival_date, departure_date))
+
+        for day in {
+            timezone.localdate(aware(cancelled_on))
+            for cancelled_on in cancellations
+            if cancelled_on
+        }:
+            DailyStats.refresh(day, day + timedelta(days=1))
+
+    @staticmethod
+    def refresh_inventory(category_id: int):
+        """Updates the rooms available of the category from today on"""
+        DailyCategoryStats.objects.filter(
+            category_id=category_id, date__gte=timezone.localdate()
+        ).update(rooms_available=Room.objects.filter(category_id=category_id).count())
+
+    @staticmethod
+    def kpis(first_date: date, end_date: date) -> dict:
+        """
+        Occupancy, ADR (revenue per room sold) and RevPAR (revenue per room
+        available) from first_date up to end_date, overall and per category.
+        Stats rows are only written for the days a reservation touches, a day
+        without one counts the current rooms of the category as available
+        """
+        days = (end_date - first_date).days
+        rooms = dict(
+            Room.objects.values("category")
+            .annotate(count=Count("pk"))
+            .values_list("category", "count")
+        )
+        stats = {
+            row["category"]: row
+            for row in DailyCategoryStats.objects.filter(
+                date__gte=first_date, date__lt=end_date
+            )
+            .values("category")
+            .annotate(
+                rooms_sold=Sum("rooms_sold"),
+                rooms_available=Sum("rooms_available"),
+                revenue=Sum("revenue"),
+                cancellations=Sum("cancellations"),
+                days=Count("pk"),
+            )
+        }
+
+        categories = []
+        for category_id, title in RoomCategory.objects.order_by("title").values_list(
+            "pk", "title"
+        ):
+            row = stats.get(category_id, {})
+            missing_days = days - row.get("days", 0)
+            categories.append(
+                with_ratios(
+                    {
+                        "category": category_id,
+                        "category__title": title,
+                        "rooms_sold": row.get("rooms_sold"),
+                        "rooms_available": (row.get("rooms_available") or 0)
+                        + missing_days * rooms.get(category_id, 0),
+                        "revenue": row.get("revenue"),
+                        "cancellations": row.get("cancellations"),
+                    }
+                )
+            )
+
+        total = with_ratios(
+            {
+                key: sum(row[key] for row in categories)
+                for key in ("rooms_sold", "rooms_available", "revenue", "cancellations")
+            }
         )
-        # Get reservations that falls within the start and end date
+        return {"total": total, "categories": categories}
 
-        # Get all the rooms under that category and remove each room of each reservation
-        # rooms: QuerySet = category.rooms
 
-        rooms = []
-        rooms_id = set()
-        
-        for reservation in reservations:
-            room = reservation.room
-            if room.pk not in rooms_id:
-                rooms.append(room)
-                rooms_id.add(room.pk)
+def local_midnight(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, dt_time.min))
 
-        # return the remaining rooms
-        return rooms
+
+def with_ratios(row: dict) -> dict:
+    sold = row["rooms_sold"] or 0
+    available = row["rooms_available"] or 0
+    revenue = row["revenue"] or 0.0
+
+    return {
+        **row,
+        "rooms_sold": sold,
+        "rooms_available": available,
+        "revenue": revenue,
+        "cancellations": row["cancellations"] or 0,
+        "occupancy": sold / available * 100 if available else 0.0,
+        "adr": revenue / sold if sold else 0.0,
+        "revpar": revenue / available if available else 0.0,
+    }
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0011_reservation_cancel_code'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('cancelled', False)), fields=['room', 'arrival_date', 'departure_date'], name='reservation_room_stay_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('cancelled', False)), fields=['departure_date', 'arrival_date'], name='reservation_stay_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['code'], name='reservation_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(condition=models.Q(('viewed', False)), fields=['id'], name='reservation_unviewed_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.CheckConstraint(check=models.Q(('departure_date__gt', models.F('arrival_date'))), name='reservation_departure_after_arrival'),
+        ),
+    ]
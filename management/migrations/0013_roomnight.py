@@ -0,0 +1,30 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0012_reservation_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='management.reservation')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='management.room')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['night', 'room'], name='room_night_night_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='roomnight',
+            constraint=models.UniqueConstraint(fields=('room', 'night'), name='room_night_unique'),
+        ),
+    ]
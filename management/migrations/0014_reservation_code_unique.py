@@ -0,0 +1,59 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:05
+
+from django.db import migrations, models
+from django.db.models import Count
+import management.models
+
+
+def dedupe_reservation_codes(apps, schema_editor):
+    """
+    Gives a new code to every reservation sharing its code with an older one
+    (or having an empty code), so the column can be made unique
+    """
+    Reservation = apps.get_model("management", "Reservation")
+
+    used = set(
+        Reservation.objects.exclude(code__isnull=True)
+        .exclude(code="")
+        .values_list("code", flat=True)
+    )
+    duplicated = (
+        Reservation.objects.values("code")
+        .annotate(total=Count("pk"))
+        .filter(total__gt=1)
+        .values_list("code", flat=True)
+    )
+
+    for code in list(duplicated) + [""]:
+        reservations = Reservation.objects.filter(code=code).order_by("pk")
+        if code:
+            # The oldest reservation keeps the code its guest already has
+            reservations = reservations[1:]
+
+        for reservation in reservations:
+            new_code = management.models.generate_reservation_code()
+            while new_code in used:
+                new_code = management.models.generate_reservation_code()
+            used.add(new_code)
+
+            Reservation.objects.filter(pk=reservation.pk).update(code=new_code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0013_roomnight'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_reservation_codes, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='reservation',
+            name='reservation_code_idx',
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='code',
+            field=models.CharField(blank=True, default=management.models.generate_reservation_code, max_length=50, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0014_reservation_code_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['arrival_date'], name='reservation_arrival_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['departure_date'], name='reservation_departure_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0015_reservation_date_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='addon',
+            name='cover_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='roomcategory',
+            name='cover_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0016_cover_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('rooms_sold', models.IntegerField(default=0)),
+                ('rooms_available', models.IntegerField(default=0)),
+                ('revenue', models.FloatField(default=0)),
+                ('cancellations', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='management.roomcategory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date'], name='daily_category_stats_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailycategorystats',
+            constraint=models.UniqueConstraint(fields=('category', 'date'), name='daily_category_stats_unique'),
+        ),
+    ]
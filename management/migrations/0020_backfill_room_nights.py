@@ -0,0 +1,47 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:10
+
+from datetime import timedelta
+
+from django.db import migrations
+
+from management.availability import stay_nights
+
+
+def backfill_room_nights(apps, schema_editor):
+    """
+    Writes the ledger nights of the active reservations made before the
+    ledger existed, with the rule of RoomNight.expected_nights. A night
+    claimed by more than one reservation is kept for the oldest one, like
+    RoomNightLedger.sync does
+    """
+    Reservation = apps.get_model("management", "Reservation")
+    RoomNight = apps.get_model("management", "RoomNight")
+
+    taken = set(RoomNight.objects.values_list("room_id", "night"))
+    nights = []
+    for pk, room_id, arrival, departure in (
+        Reservation.objects.filter(cancelled=False)
+        .order_by("pk")
+        .values_list("pk", "room_id", "arrival_date", "departure_date")
+        .iterator(chunk_size=2000)
+    ):
+        first, end = stay_nights(arrival, departure)
+        for i in range((end - first).days):
+            key = (room_id, first + timedelta(days=i))
+            if key in taken:
+                continue
+            taken.add(key)
+            nights.append(RoomNight(room_id=room_id, night=key[1], reservation_id=pk))
+
+    RoomNight.objects.bulk_create(nights, batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0019_sequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_room_nights, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:20
+
+from collections import Counter
+
+from django.db import migrations
+from django.db.models import Count
+from django.utils import timezone
+
+from management.availability import aware
+
+
+def backfill_daily_stats(apps, schema_editor):
+    """
+    Writes the daily stats of the days with ledger nights or cancellations,
+    with the rules of DailyStats.refresh: a night earns the successful payment
+    of its reservation spread over its nights, or the category price
+    """
+    Room = apps.get_model("management", "Room")
+    RoomNight = apps.get_model("management", "RoomNight")
+    Reservation = apps.get_model("management", "Reservation")
+    DailyCategoryStats = apps.get_model("management", "DailyCategoryStats")
+
+    rooms = dict(
+        Room.objects.values("category")
+        .annotate(count=Count("pk"))
+        .values_list("category", "count")
+    )
+    reservation_nights = Counter(
+        RoomNight.objects.values_list("reservation_id", flat=True).iterator()
+    )
+
+    sold = Counter()
+    revenue = Counter()
+    for night, category_id, reservation_id, status, amount, price in (
+        RoomNight.objects.values_list(
+            "night",
+            "room__category",
+            "reservation_id",
+            "reservation__payment__status",
+            "reservation__payment__amount",
+            "room__category__price",
+        ).iterator(chunk_size=2000)
+    ):
+        sold[night, category_id] += 1
+        revenue[night, category_id] += (
+            amount / reservation_nights[reservation_id]
+            if status == "success"
+            else price
+        )
+
+    cancellations = Counter(
+        (timezone.localdate(aware(cancelled_on)), category_id)
+        for cancelled_on, category_id in Reservation.objects.filter(
+            cancelled=True, cancelled_on__isnull=False
+        )
+        .values_list("cancelled_on", "room__category")
+        .iterator(chunk_size=2000)
+    )
+
+    DailyCategoryStats.objects.bulk_create(
+        [
+            DailyCategoryStats(
+                category_id=category_id,
+                date=day,
+                rooms_sold=sold[day, category_id],
+                rooms_available=rooms.get(category_id, 0),
+                revenue=revenue[day, category_id],
+                cancellations=cancellations[day, category_id],
+            )
+            for day, category_id in set(sold) | set(cancellations)
+        ],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["category", "date"],
+        update_fields=["rooms_sold", "rooms_available", "revenue", "cancellations"],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0020_backfill_room_nights'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
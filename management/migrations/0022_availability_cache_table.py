@@ -0,0 +1,22 @@
+# Generated by Django 4.2.1 on 2026-10-18 13:05
+
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_tables(apps, schema_editor):
+    """The tables of the database caches (see CACHES in the settings)"""
+    call_command(
+        "createcachetable", database=schema_editor.connection.alias, verbosity=0
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0021_backfill_daily_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_tables, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,23 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.forms import ValidationError
 from django.utils.datetime_safe import datetime
+from datetime import timedelta
 import string
 import random
 
+from .availability import stay_nights
+
 
 class RoomCategory(models.Model):
     price = models.FloatField()
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     cover = models.FileField(blank=True, upload_to="rooms")
+    # Content hash of the cover, set once its resized variants exist (see
+    # management.images)
+    cover_hash = models.CharField(max_length=16, blank=True, editable=False)
 
     def __str__(self) -> str:
         return self.title
@@ -28,6 +36,7 @@ class AddOn(models.Model):
     price = models.FloatField()
     render = models.TextField(blank=True, null=True)
     cover = models.FileField(blank=True, upload_to="rooms")
+    cover_hash = models.CharField(max_length=16, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.title} {self.price}"
@@ -87,6 +96,15 @@ class Customer(models.Model):
 
         return f"{value[:4]}{'*'*(size-6)}{value[size-2:size]}"
 
+    class Meta:
+        # Case insensitive guest search of the admin reservation list, see
+        # filters.search_reservations
+        indexes = [
+            models.Index(Lower("first_name"), name="customer_first_name_idx"),
+            models.Index(Lower("last_name"), name="customer_last_name_idx"),
+            models.Index(Lower("email_address"), name="customer_email_idx"),
+        ]
+
 
 class Payment(models.Model):
     PENDING = "pending"
@@ -155,7 +173,7 @@ class Reservation(models.Model):
         Customer, on_delete=models.SET_NULL, null=True, related_name="reservations"
     )
 
-    code = models.CharField(unique=False, default = generate_reservation_code, max_length=50, blank=True,null = True)
+    code = models.CharField(unique=True, default = generate_reservation_code, max_length=50, blank=True,null = True)
 
     # Holds the customer information just incase the customer was deleted
     customer_raw = models.JSONField(null=True, blank=True, default=dict)
@@ -197,8 +215,184 @@ class Reservation(models.Model):
     # The date the guest canceled the request
     cancelled_on = models.DateTimeField(blank=True, null=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stay the row was loaded with, so a change of dates can also
+        # invalidate what was cached for the previous dates
+        instance._loaded_stay = (
+            instance.__dict__.get("arrival_date"),
+            instance.__dict__.get("departure_date"),
+        )
+        # And the viewed state, for the new reservations counter
+        instance._loaded_viewed = instance.__dict__.get("viewed")
+        # And the cancellation day, its daily stats change when it does
+        instance._loaded_cancelled_on = instance.__dict__.get("cancelled_on")
+        return instance
+
+    class Meta:
+        indexes = [
+            # Overlap checks of a single room (availability anti-join)
+            models.Index(
+                fields=["room", "arrival_date", "departure_date"],
+                condition=models.Q(cancelled=False),
+                name="reservation_room_stay_idx",
+            ),
+            # Overlap checks across every room (taken rooms, calendars)
+            models.Index(
+                fields=["departure_date", "arrival_date"],
+                condition=models.Q(cancelled=False),
+                name="reservation_stay_idx",
+            ),
+            # Arrival and departure windows of the reservations API filters
+            models.Index(fields=["arrival_date"], name="reservation_arrival_idx"),
+            models.Index(fields=["departure_date"], name="reservation_departure_idx"),
+            # New (unviewed) reservations counted and listed on the admin
+            models.Index(
+                fields=["id"],
+                condition=models.Q(viewed=False),
+                name="reservation_unviewed_idx",
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=models.Q(departure_date__gt=models.F("arrival_date")),
+                name="reservation_departure_after_arrival",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # Random codes can repeat, draw again until the code is unused
+            while (
+                not self.code
+                or Reservation.objects.filter(code=self.code).exists()
+            ):
+                self.code = generate_reservation_code()
+
+        # The ledger nights are written in the same transaction as the
+        # reservation, so a night already taken rejects the whole save
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            RoomNight.record(self)
+
     def __str__(self) -> str:
         return f"{'Paid' if self.paid else ''} {self.arrival_date.date()} - {self.departure_date.date()} | {self.room}"
 
 
+class RoomNight(models.Model):
+    """
+    Inventory ledger, one row for every night a room is taken by an active
+    (not cancelled) reservation. The unique (room, night) constraint makes
+    the database reject a double booking
+    """
+
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="nights")
+    night = models.DateField()
+    reservation = models.ForeignKey(
+        Reservation, on_delete=models.CASCADE, related_name="nights"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["room", "night"], name="room_night_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["night", "room"], name="room_night_night_idx"),
+        ]
+
+    @classmethod
+    def expected_nights(cls, reservation: Reservation) -> list["RoomNight"]:
+        if reservation.cancelled:
+            return []
+
+        first, end = stay_nights(reservation.arrival_date, reservation.departure_date)
+        return [
+            cls(
+                room_id=reservation.room_id,
+                night=first + timedelta(days=i),
+                reservation_id=reservation.pk,
+            )
+            for i in range((end - first).days)
+        ]
+
+    @classmethod
+    def record(cls, reservation: Reservation):
+        """
+        Replaces the ledger nights of the reservation with the nights of its
+        current room and dates (none when it is cancelled)
+        """
+        cls.objects.filter(reservation=reservation).delete()
+        cls.objects.bulk_create(cls.expected_nights(reservation))
+
+    def __str__(self) -> str:
+        return f"{self.night} | Room {self.room_id}"
+
+
+class Sequence(models.Model):
+    """
+    Named counters handing out blocks of consecutive numbers, like the room
+    numbers of bulk provisioned rooms
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    @classmethod
+    def next_block(cls, name: str, count: int, initial=lambda: 0) -> int:
+        """
+        Reserves `count` consecutive numbers of the sequence and returns the
+        first one. A new sequence starts after `initial()`.
+        The row is updated before it is read, so concurrent blocks are
+        serialized by its write lock and never overlap
+        """
+        with transaction.atomic():
+            if not cls.objects.filter(name=name).update(value=F("value") + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(name=name, value=initial() + count)
+                except IntegrityError:
+                    # Created meanwhile by a concurrent block
+                    cls.objects.filter(name=name).update(value=F("value") + count)
+
+            last = cls.objects.filter(name=name).values_list("value", flat=True).get()
+        return last - count + 1
+
+    def __str__(self) -> str:
+        return f"{self.name} {self.value}"
+
+
+class DailyCategoryStats(models.Model):
+    """
+    Occupancy and revenue of a room category on a day, kept up to date from
+    the reservation ledger (see managers.DailyStats) for the dashboard KPIs
+    """
+
+    category = models.ForeignKey(
+        RoomCategory, on_delete=models.CASCADE, related_name="daily_stats"
+    )
+    date = models.DateField()
+    # Nights of the category's rooms taken by active reservations
+    rooms_sold = models.IntegerField(default=0)
+    # Rooms of the category
+    rooms_available = models.IntegerField(default=0)
+    # Room revenue of the nights sold
+    revenue = models.FloatField(default=0)
+    # Reservations of the category cancelled that day
+    cancellations = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["category", "date"], name="daily_category_stats_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["date"], name="daily_category_stats_date_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.date} | {self.category_id}"
+
+
 # Create your models here.
@@ -0,0 +1,81 @@
+"""
+Vectorized occupancy of every room over a range of nights.
+
+The taken nights of the range are read from the nights ledger in one query
+and turned into a boolean rooms x nights array (True = the room is taken
+that night), every calendar question is then an array reduction over that
+matrix instead of one availability query per night.
+"""
+from datetime import date, timedelta
+
+import numpy as np
+
+from .models import Room, RoomCategory, RoomNight
+
+
+class OccupancyMatrix:
+    def __init__(
+        self,
+        start: date,
+        room_ids: np.ndarray,
+        category_ids: np.ndarray,
+        occupied: np.ndarray,
+    ):
+        self.start = start
+        self.room_ids = room_ids
+        self.category_ids = category_ids
+        self.occupied = occupied
+
+    @classmethod
+    def build(cls, start: date, nights: int, category: RoomCategory = None):
+        """
+        Builds the occupancy of the rooms (optionally limited to a category)
+        for the nights start, start + 1, ... start + nights - 1
+        """
+        rooms = Room.objects.order_by("pk")
+        if category:
+            rooms = rooms.filter(category=category)
+
+        room_rows = np.array(
+            list(rooms.values_list("pk", "category_id")), dtype=np.int64
+        ).reshape(-1, 2)
+        room_ids, category_ids = room_rows[:, 0], room_rows[:, 1]
+
+        nights_taken = RoomNight.objects.filter(
+            night__gte=start, night__lt=start + timedelta(days=nights)
+        )
+        if category:
+            nights_taken = nights_taken.filter(room__category=category)
+
+        occupied = np.zeros((len(room_ids), nights), dtype=bool)
+        rows, offsets = [], []
+        for room_id, night in nights_taken.values_list("room_id", "night").iterator():
+            rows.append(room_id)
+            offsets.append((night - start).days)
+
+        if rows and len(room_ids):
+            rows = np.array(rows, dtype=np.int64)
+            positions = np.minimum(
+                np.searchsorted(room_ids, rows), len(room_ids) - 1
+            )
+            # The rooms are read in a separate query, nights of rooms created
+            # since then have no row and are left out
+            known = room_ids[positions] == rows
+            occupied[positions[known], np.array(offsets)[known]] = True
+
+        return cls(start, room_ids, category_ids, occupied)
+
+    @property
+    def nights(self) -> int:
+        return self.occupied.shape[1]
+
+    @property
+    def dates(self) -> list[date]:
+        return [self.start + timedelta(days=i) for i in range(self.nights)]
+
+    def category_free_counts(self) -> dict[int, np.ndarray]:
+        """The number of free rooms on each night for every category"""
+        categories, rows = np.unique(self.category_ids, return_inverse=True)
+        counts = np.zeros((len(categories), self.nights), dtype=np.int64)
+        np.add.at(counts, rows, ~self.occupied)
+        return dict(zip(categories.tolist(), counts))
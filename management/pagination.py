@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ReservationCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the reservations, newest first. The cursor holds
+    the last id seen so every page is an indexed range scan whatever its depth
+    """
+
+    ordering = "-id"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
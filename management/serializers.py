@@ -1,15 +1,54 @@
 from rest_framework import serializers
 
+from .fieldsets import FULL, FieldSet
+from .images import variant_urls
 from .models import Customer, Reservation, Room, RoomCategory
 
 
-class RoomCategorySerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Keeps the fields of the FieldSet (see management.fieldsets), relations
+    that are not expanded are rendered as their primary key
+    """
+
+    def __init__(self, *args, fieldset: FieldSet = FULL, **kwargs):
+        self.fieldset = fieldset
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.fieldset.is_full:
+            return fields
+
+        sparse = {}
+        for name, field in fields.items():
+            if not self.fieldset.includes(name):
+                continue
+
+            if isinstance(field, serializers.BaseSerializer):
+                if self.fieldset.expands(name):
+                    field.fieldset = self.fieldset.child(name)
+                else:
+                    field = serializers.PrimaryKeyRelatedField(read_only=True)
+
+            sparse[name] = field
+        return sparse
+
+
+class RoomCategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    cover_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = RoomCategory
-        fields = ("pk", "title", "description", "price", "cover")
+        fields = ("pk", "title", "description", "price", "cover", "cover_variants")
+
+    def get_cover_variants(self, category: RoomCategory):
+        return variant_urls(
+            category.cover.storage, category.cover.name, category.cover_hash
+        )
 
 
-class RoomSerializer(serializers.ModelSerializer):
+class RoomSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category = RoomCategorySerializer()
 
     class Meta:
@@ -17,7 +56,7 @@ class RoomSerializer(serializers.ModelSerializer):
         fields = ("pk", "number", "category", "description", "unique", "addon")
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = (
@@ -31,7 +70,7 @@ class CustomerSerializer(serializers.ModelSerializer):
         )
 
 
-class SecureCustomerSerializer(serializers.ModelSerializer):
+class SecureCustomerSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = (
@@ -45,7 +84,7 @@ class SecureCustomerSerializer(serializers.ModelSerializer):
         )
 
 
-class ReservationSerializer(serializers.ModelSerializer):
+class ReservationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     customer = CustomerSerializer()
     room = RoomSerializer()
 
@@ -71,7 +110,7 @@ class ReservationSerializer(serializers.ModelSerializer):
         )
 
 
-class SecureReservationSerializer(serializers.ModelSerializer):
+class SecureReservationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     customer = SecureCustomerSerializer()
     room = RoomSerializer()
 
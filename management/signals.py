@@ -0,0 +1,130 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .availability import stay_nights
+from .cache import (
+    availability_cache,
+    catalog_version,
+    dashboard_counters,
+)
+from .images import schedule_cover_variants
+from .managers import DailyStats, local_midnight
+from .models import AddOn, Reservation, Room, RoomCategory
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def invalidate_reservation_availability(sender, instance: Reservation, **kwargs):
+    stays = [(instance.arrival_date, instance.departure_date)]
+
+    arrival_date, departure_date = getattr(instance, "_loaded_stay", (None, None))
+    if arrival_date and departure_date:
+        stays.append((arrival_date, departure_date))
+
+    # Availability is decided by the ledger nights of the stays, which can
+    # reach past their exact dates
+    windows = []
+    for stay in stays:
+        first, end = stay_nights(*stay)
+        windows += [stay, (local_midnight(first), local_midnight(end))]
+
+    def invalidate():
+        for window in windows:
+            availability_cache.invalidate_window(*window)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_room_availability(sender, instance: Room, **kwargs):
+    transaction.on_commit(availability_cache.invalidate_rooms)
+
+
+@receiver(post_save, sender=RoomCategory)
+@receiver(post_delete, sender=RoomCategory)
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=AddOn)
+@receiver(post_delete, sender=AddOn)
+def bump_catalog_version(sender, instance, **kwargs):
+    transaction.on_commit(catalog_version.bump, robust=True)
+
+
+@receiver(pre_save, sender=RoomCategory)
+@receiver(pre_save, sender=AddOn)
+def reset_cover_hash(sender, instance, **kwargs):
+    # A new upload or a removed cover, the variants of the old one no longer
+    # apply
+    if not instance.cover or not instance.cover._committed:
+        instance.cover_hash = ""
+
+
+@receiver(post_save, sender=RoomCategory)
+@receiver(post_save, sender=AddOn)
+def make_cover_variants(sender, instance, raw=False, **kwargs):
+    if instance.cover and not raw:
+        schedule_cover_variants(instance)
+
+
+@receiver(post_save, sender=Reservation)
+def count_saved_reservation(sender, instance: Reservation, created=False, **kwargs):
+    if created:
+        delta = int(not instance.viewed)
+    elif hasattr(instance, "_loaded_viewed"):
+        delta = int(not instance.viewed) - int(not instance._loaded_viewed)
+    else:
+        # Not loaded from the database, the previous state is unknown
+        transaction.on_commit(dashboard_counters.rebuild, robust=True)
+        return
+
+    instance._loaded_viewed = instance.viewed
+    if delta:
+        dashboard_counters.add("new_reservations", delta)
+
+
+@receiver(post_delete, sender=Reservation)
+def count_deleted_reservation(sender, instance: Reservation, **kwargs):
+    if not getattr(instance, "_loaded_viewed", instance.viewed):
+        dashboard_counters.add("new_reservations", -1)
+
+
+@receiver(post_save, sender=RoomCategory)
+@receiver(post_save, sender=Room)
+def count_created_catalog_row(sender, instance, created=False, **kwargs):
+    if created:
+        name = "rooms" if sender is Room else "categories"
+        dashboard_counters.add(name, 1)
+
+
+@receiver(post_delete, sender=RoomCategory)
+@receiver(post_delete, sender=Room)
+def count_deleted_catalog_row(sender, instance, **kwargs):
+    name = "rooms" if sender is Room else "categories"
+    dashboard_counters.add(name, -1)
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def refresh_reservation_stats(sender, instance: Reservation, **kwargs):
+    stays = [
+        (instance.arrival_date, instance.departure_date),
+        getattr(instance, "_loaded_stay", (None, None)),
+    ]
+    cancellations = [
+        instance.cancelled_on,
+        getattr(instance, "_loaded_cancelled_on", None),
+    ]
+    transaction.on_commit(
+        lambda: DailyStats.refresh_reservation(stays, cancellations), robust=True
+    )
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def refresh_room_stats(sender, instance: Room, **kwargs):
+    category_id = instance.category_id
+    transaction.on_commit(
+        lambda: DailyStats.refresh_inventory(category_id), robust=True
+    )
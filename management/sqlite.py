@@ -0,0 +1,47 @@
+"""
+SQLite tuning applied to every new database connection.
+
+The pragmas come from settings.SQLITE_PRAGMAS (empty by default, filled by
+the production database profile, see DATABASE_PROFILE in the settings):
+- journal_mode=WAL lets readers run while a write is in flight, instead of
+  every reader waiting for the writer to commit
+- synchronous=NORMAL only syncs at checkpoints, safe from corruption in
+  WAL mode (a power loss can lose the last commits, not the database)
+- busy_timeout makes a connection wait for the write lock instead of
+  failing right away with "database is locked"
+- mmap_size and cache_size keep the hot pages in memory
+
+Django 4.2 starts SQLite transactions as deferred, a transaction that reads
+before it writes can still fail when it takes the write lock while another
+one commits; bookings retry on that (see RoomManager.book_room).
+"""
+from django.conf import settings
+
+
+PRODUCTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 20_000,
+    "mmap_size": 256 * 1024 * 1024,
+    # Negative sizes are in KiB
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+def pragma_statements(pragmas: dict) -> list[str]:
+    return [f"PRAGMA {name} = {value}" for name, value in pragmas.items()]
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """connection_created receiver"""
+    if connection.vendor != "sqlite":
+        return
+
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", None)
+    if not pragmas:
+        return
+
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(pragmas):
+            cursor.execute(statement)
@@ -1,3 +1,551 @@
-from django.test import TestCase
+import threading
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.db import IntegrityError, OperationalError, connections, transaction
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .fast_serializers import (
+    FastReservationSerializer,
+    FastRoomCategorySerializer,
+    FastRoomSerializer,
+    FastSecureReservationSerializer,
+)
+from .cache import availability_cache, dashboard_counters
+from .fieldsets import FULL, FieldSet
+from .managers import ReservationManager, RoomManager, RoomNightLedger
+from .models import (
+    Customer,
+    DailyCategoryStats,
+    Payment,
+    Reservation,
+    Room,
+    RoomCategory,
+    RoomNight,
+)
+from .occupancy import OccupancyMatrix
+from .serializers import (
+    ReservationSerializer,
+    RoomCategorySerializer,
+    RoomSerializer,
+    SecureReservationSerializer,
+)
+
+
+def new_customer(name: str) -> Customer:
+    return Customer(
+        first_name=name,
+        last_name="Test",
+        id_type="national_id",
+        id_number="12345678901",
+        email_address=f"{name.lower()}@example.com",
+        phone_number="08012345678",
+    )
+
+
+class FastSerializerParityTests(TestCase):
+    """The fast read serializers render the same JSON as the model ones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [
+            RoomCategory.objects.create(
+                title="Standard", description="A quiet room", price=100.5
+            ),
+            RoomCategory.objects.create(
+                title="Suite", price=250, cover="rooms/teir-1.jpg"
+            ),
+        ]
+        RoomCategory.objects.filter(pk=categories[1].pk).update(
+            cover_hash="0123456789abcdef"
+        )
+
+        rooms = [
+            Room.objects.create(
+                category=categories[i % 2],
+                number=str(i + 1),
+                description="Sea view" if i % 2 else None,
+                addon={"bed": "king"} if i % 3 else {},
+            )
+            for i in range(4)
+        ]
+
+        now = timezone.now()
+        for i in range(12):
+            customer = new_customer(f"Guest{i}")
+            customer.save()
+            payment = (
+                Payment.objects.create(amount=100.0 * i, customer=customer)
+                if i % 4 == 0
+                else None
+            )
+            arrival = now + timedelta(days=3 * i, minutes=i)
+            Reservation.objects.create(
+                room=rooms[i % 4],
+                customer=customer if i % 5 else None,
+                reservation_type=Reservation.RESERVATION,
+                arrival_date=arrival,
+                departure_date=arrival + timedelta(days=2, hours=3),
+                reservated_on=now,
+                guests=[{"name": "Guest"}] if i % 2 else [],
+                paid=payment is not None,
+                payment=payment,
+                cancelled=i % 7 == 0,
+                cancelled_on=now if i % 7 == 0 else None,
+            )
+
+    def assertSameJSON(self, model_data, fast_data):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(model_data), renderer.render(fast_data))
+
+    def fieldset(self, query: str) -> FieldSet:
+        return FieldSet.from_params(QueryDict(query))
+
+    def test_reservations(self):
+        reservations = Reservation.objects.select_related(
+            "room__category", "customer"
+        ).order_by("pk")
+        self.assertSameJSON(
+            ReservationSerializer(reservations, many=True).data,
+            FastReservationSerializer().serialize(reservations),
+        )
+
+    def test_secure_reservations(self):
+        reservations = Reservation.objects.select_related(
+            "room__category", "customer"
+        ).order_by("pk")
+        self.assertSameJSON(
+            SecureReservationSerializer(reservations, many=True).data,
+            FastSecureReservationSerializer().serialize(reservations),
+        )
+
+    def test_rooms(self):
+        rooms = Room.objects.select_related("category").order_by("pk")
+        self.assertSameJSON(
+            RoomSerializer(rooms, many=True).data,
+            FastRoomSerializer().serialize(rooms),
+        )
+
+    def test_categories(self):
+        categories = RoomCategory.objects.order_by("pk")
+        self.assertSameJSON(
+            RoomCategorySerializer(categories, many=True).data,
+            FastRoomCategorySerializer().serialize(categories),
+        )
+
+    def test_sparse_fieldsets(self):
+        queries = (
+            "fields=pk,code",
+            "expand=",
+            "expand=room",
+            "fields=pk,room.number,customer.first_name",
+            "fields=pk,room&expand=room.category",
+        )
+        for query in queries:
+            with self.subTest(query=query):
+                fieldset = self.fieldset(query)
+                serializer = FastSecureReservationSerializer(fieldset=fieldset)
+                reservations = serializer.narrow(Reservation.objects.order_by("pk"))
+                self.assertSameJSON(
+                    SecureReservationSerializer(
+                        reservations, many=True, fieldset=fieldset
+                    ).data,
+                    serializer.serialize(reservations),
+                )
+
+    def test_full_fieldset(self):
+        self.assertTrue(FULL.is_full)
+        self.assertTrue(self.fieldset("").is_full)
+
+
+class RoomAllocationTests(TransactionTestCase):
+    """Concurrent bookings never share a room"""
+
+    def setUp(self):
+        self.category = RoomCategory.objects.create(title="Standard", price=100)
+        Room.objects.bulk_create(
+            [Room(category=self.category, number=str(i + 1)) for i in range(3)]
+        )
+        self.arrival = timezone.now() + timedelta(days=30)
+
+    def new_reservation(self, name: str) -> Reservation:
+        return Reservation(
+            customer=new_customer(name),
+            reservation_type=Reservation.RESERVATION,
+            arrival_date=self.arrival,
+            departure_date=self.arrival + timedelta(days=2),
+            reservated_on=timezone.now(),
+        )
+
+    def test_concurrent_bookings(self):
+        threads = 8
+        results = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads)
+
+        def book(worker: int):
+            barrier.wait()
+            try:
+                reservation = self.new_reservation(f"Guest{worker}")
+                try:
+                    outcome = RoomManager.allocate_room(self.category, reservation)
+                except OperationalError:
+                    outcome = None
+                with lock:
+                    results.append(outcome)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=book, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        booked = Reservation.objects.filter(room__category=self.category)
+        self.assertEqual(results.count(True), booked.count())
+        self.assertGreater(booked.count(), 0)
+        self.assertLessEqual(booked.count(), 3)
+        self.assertEqual(booked.values("room").distinct().count(), booked.count())
+
+    def test_sold_out(self):
+        for i in range(3):
+            self.assertTrue(
+                RoomManager.allocate_room(self.category, self.new_reservation(f"G{i}"))
+            )
+        self.assertFalse(
+            RoomManager.allocate_room(self.category, self.new_reservation("Late"))
+        )
+
+    def test_failing_commit_hook_books_once(self):
+        invalidate_window = availability_cache.invalidate_window
+        calls = []
+
+        def fail_once(*args, **kwargs):
+            if not calls:
+                calls.append(True)
+                raise OperationalError("database is locked")
+            return invalidate_window(*args, **kwargs)
+
+        reservation = self.new_reservation("Guest")
+        with mock.patch.object(
+            availability_cache, "invalidate_window", fail_once
+        ), self.assertLogs("management.managers", "ERROR"):
+            self.assertTrue(RoomManager.allocate_room(self.category, reservation))
+
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertEqual(Reservation.objects.get().pk, reservation.pk)
+
+
+class RoomNightLedgerTests(TestCase):
+    """The nights ledger follows the reservations and rejects double bookings"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = RoomCategory.objects.create(title="Standard", price=100)
+        cls.room = Room.objects.create(category=category, number="1")
+        cls.other_room = Room.objects.create(category=category, number="2")
+        cls.arrival = timezone.make_aware(datetime(2030, 1, 10, 14))
+
+    def book(self, room: Room, arrival: datetime, nights: int) -> Reservation:
+        return Reservation.objects.create(
+            room=room,
+            reservation_type=Reservation.RESERVATION,
+            arrival_date=arrival,
+            departure_date=arrival + timedelta(days=nights, hours=-4),
+            reservated_on=arrival,
+        )
+
+    def nights(self, reservation: Reservation) -> list[tuple[int, date]]:
+        return list(
+            RoomNight.objects.filter(reservation=reservation)
+            .order_by("night")
+            .values_list("room_id", "night")
+        )
+
+    def test_save_writes_nights(self):
+        reservation = self.book(self.room, self.arrival, 2)
+        self.assertEqual(
+            self.nights(reservation),
+            [(self.room.pk, date(2030, 1, 10)), (self.room.pk, date(2030, 1, 11))],
+        )
+
+    def test_same_day_stay_takes_one_night(self):
+        reservation = Reservation.objects.create(
+            room=self.room,
+            reservation_type=Reservation.RESERVATION,
+            arrival_date=self.arrival.replace(hour=8),
+            departure_date=self.arrival.replace(hour=20),
+            reservated_on=self.arrival,
+        )
+        self.assertEqual(self.nights(reservation), [(self.room.pk, date(2030, 1, 10))])
+
+    def test_cancel_frees_nights(self):
+        reservation = self.book(self.room, self.arrival, 2)
+        reservation.cancelled = True
+        reservation.cancelled_on = timezone.now()
+        reservation.save()
+        self.assertEqual(self.nights(reservation), [])
+
+    def test_changes_move_nights(self):
+        reservation = self.book(self.room, self.arrival, 2)
+        reservation.room = self.other_room
+        reservation.arrival_date += timedelta(days=5)
+        reservation.departure_date += timedelta(days=5)
+        reservation.save()
+        self.assertEqual(
+            self.nights(reservation),
+            [
+                (self.other_room.pk, date(2030, 1, 15)),
+                (self.other_room.pk, date(2030, 1, 16)),
+            ],
+        )
+
+    def test_taken_night_is_rejected(self):
+        self.book(self.room, self.arrival, 2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.book(self.room, self.arrival + timedelta(days=1), 2)
+
+        self.assertEqual(Reservation.objects.count(), 1)
+        # The departure day is free again
+        self.book(self.room, self.arrival + timedelta(days=2), 1)
+
+    def test_sync_repairs_drift(self):
+        kept = self.book(self.room, self.arrival, 2)
+        lost = self.book(self.other_room, self.arrival, 1)
+        RoomNight.objects.filter(reservation=lost).delete()
+        RoomNight.objects.create(
+            room=self.room, night=date(2030, 2, 1), reservation=kept
+        )
+
+        self.assertEqual(
+            RoomNightLedger.sync(fix=True),
+            {"missing": 1, "stale": 1, "conflicts": 0},
+        )
+        self.assertEqual(
+            RoomNightLedger.sync(fix=False),
+            {"missing": 0, "stale": 0, "conflicts": 0},
+        )
+        self.assertEqual(len(self.nights(kept)), 2)
+        self.assertEqual(len(self.nights(lost)), 1)
+
+    def test_taken_rooms_agree_with_free_rooms(self):
+        self.book(self.room, self.arrival.replace(hour=8), 1)
+        # Same day stays after the guest left still take that night
+        start = self.arrival.replace(hour=21)
+        end = start + timedelta(hours=1)
+
+        taken = RoomManager.taken_rooms(start, end)
+        free = RoomManager.query_free_rooms(None, start, end)
+        self.assertEqual(list(taken), [self.room])
+        self.assertEqual(list(free), [self.other_room])
+
+    def test_backfill_keeps_the_oldest_claimant(self):
+        backfill = import_module(
+            "management.migrations.0020_backfill_room_nights"
+        ).backfill_room_nights
+
+        first = self.book(self.room, self.arrival, 2)
+        RoomNight.objects.all().delete()
+        # Made before the ledger existed, overlapping the first one
+        second = self.book(self.room, self.arrival + timedelta(days=5), 1)
+        Reservation.objects.filter(pk=second.pk).update(
+            arrival_date=self.arrival + timedelta(days=1),
+            departure_date=self.arrival + timedelta(days=3),
+        )
+        RoomNight.objects.all().delete()
+
+        backfill(django_apps, None)
+
+        self.assertEqual(len(self.nights(first)), 2)
+        self.assertEqual(self.nights(second), [(self.room.pk, date(2030, 1, 12))])
+
+
+class DailyStatsTests(TransactionTestCase):
+    """The daily stats follow the reservations, their cancellations included"""
+
+    def setUp(self):
+        self.category = RoomCategory.objects.create(title="Standard", price=100)
+        self.room = Room.objects.create(category=self.category, number="1")
+        self.arrival = timezone.make_aware(datetime(2030, 1, 10, 14))
+        self.cancelled_on = timezone.make_aware(datetime(2030, 1, 2, 9))
+
+    def book(self) -> Reservation:
+        return Reservation.objects.create(
+            room=self.room,
+            reservation_type=Reservation.RESERVATION,
+            arrival_date=self.arrival,
+            departure_date=self.arrival + timedelta(days=2),
+            reservated_on=self.arrival,
+        )
+
+    def stats(self) -> dict[date, tuple[int, int]]:
+        return {
+            day: (sold, cancellations)
+            for day, sold, cancellations in DailyCategoryStats.objects.filter(
+                category=self.category
+            ).values_list("date", "rooms_sold", "cancellations")
+            if sold or cancellations
+        }
+
+    def test_uncancel_then_delete(self):
+        reservation = self.book()
+        reservation.cancelled = True
+        reservation.cancelled_on = self.cancelled_on
+        reservation.save()
+        self.assertEqual(self.stats(), {date(2030, 1, 2): (0, 1)})
+
+        reservation = Reservation.objects.get(pk=reservation.pk)
+        reservation.cancelled = False
+        reservation.cancelled_on = None
+        reservation.save()
+        self.assertEqual(
+            self.stats(), {date(2030, 1, 10): (1, 0), date(2030, 1, 11): (1, 0)}
+        )
+
+        Reservation.objects.get(pk=reservation.pk).delete()
+        self.assertEqual(self.stats(), {})
+
+    def test_backfill(self):
+        backfill = import_module(
+            "management.migrations.0021_backfill_daily_stats"
+        ).backfill_daily_stats
+
+        self.book()
+        Reservation.objects.create(
+            room=self.room,
+            reservation_type=Reservation.RESERVATION,
+            arrival_date=self.arrival + timedelta(days=5),
+            departure_date=self.arrival + timedelta(days=6),
+            reservated_on=self.arrival,
+            cancelled=True,
+            cancelled_on=self.cancelled_on,
+        )
+        expected = self.stats()
+        DailyCategoryStats.objects.all().delete()
+
+        backfill(django_apps, None)
+
+        self.assertEqual(self.stats(), expected)
+        self.assertEqual(len(expected), 3)
+
+
+class DashboardCountersTests(TestCase):
+    """The dashboard counters follow the writes they count"""
+
+    def setUp(self):
+        self.category = RoomCategory.objects.create(title="Standard", price=100)
+        self.room = Room.objects.create(category=self.category, number="1")
+        self.arrival = timezone.make_aware(datetime(2030, 1, 10, 14))
+
+    def book(self, days: int = 0) -> Reservation:
+        arrival = self.arrival + timedelta(days=days)
+        return Reservation.objects.create(
+            room=self.room,
+            reservation_type=Reservation.RESERVATION,
+            arrival_date=arrival,
+            departure_date=arrival + timedelta(days=1),
+            reservated_on=arrival,
+        )
+
+    def test_counters(self):
+        self.assertEqual(
+            dashboard_counters.get(),
+            {"new_reservations": 0, "categories": 1, "rooms": 1},
+        )
+
+        reservation = self.book()
+        self.book(days=3).delete()
+        RoomManager.provision_rooms(self.category, 2)
+        self.assertEqual(
+            dashboard_counters.get(),
+            {"new_reservations": 1, "categories": 1, "rooms": 3},
+        )
+
+        self.assertTrue(ReservationManager.mark_viewed(reservation))
+        self.assertEqual(dashboard_counters.get()["new_reservations"], 0)
+
+    def test_rolled_back_write_is_not_counted(self):
+        dashboard_counters.get()
+        with self.assertRaises(ValueError), transaction.atomic():
+            RoomCategory.objects.create(title="Suite", price=200)
+            raise ValueError
+
+        self.assertEqual(dashboard_counters.get()["categories"], 1)
+
+
+class OccupancyMatrixTests(TestCase):
+    """The occupancy matrix marks the ledger nights of the rooms it read"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = RoomCategory.objects.create(title="Standard", price=100)
+        cls.rooms = [
+            Room.objects.create(category=category, number=str(i + 1))
+            for i in range(4)
+        ]
+        arrival = timezone.make_aware(datetime(2030, 1, 10, 14))
+        for room in cls.rooms:
+            Reservation.objects.create(
+                room=room,
+                reservation_type=Reservation.RESERVATION,
+                arrival_date=arrival,
+                departure_date=arrival + timedelta(days=1),
+                reservated_on=arrival,
+            )
+        cls.start = date(2030, 1, 9)
+
+    def test_build(self):
+        occupancy = OccupancyMatrix.build(self.start, 3)
+        self.assertEqual(occupancy.room_ids.tolist(), [r.pk for r in self.rooms])
+        self.assertEqual(occupancy.occupied.tolist(), [[False, True, False]] * 4)
+
+    def test_rooms_created_after_the_room_query_are_left_out(self):
+        # As if rooms 2 and 4 were created between the two queries
+        rooms = Room.objects.exclude(
+            pk__in=[self.rooms[1].pk, self.rooms[3].pk]
+        ).order_by("pk")
+        with mock.patch.object(Room.objects, "order_by", return_value=rooms):
+            occupancy = OccupancyMatrix.build(self.start, 3)
+
+        self.assertEqual(
+            occupancy.room_ids.tolist(), [self.rooms[0].pk, self.rooms[2].pk]
+        )
+        self.assertEqual(occupancy.occupied.tolist(), [[False, True, False]] * 2)
+
+
+class CatalogConditionTests(TestCase):
+    """The catalog ETags validate the rows that exist only"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = RoomCategory.objects.create(title="Standard", price=100)
+
+    def test_existing_category(self):
+        for url in (
+            f"/api/categories/{self.category.pk}/",
+            f"/api/categories/{self.category.pk}/rooms/",
+        ):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response.headers["ETag"]
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_missing_category(self):
+        for url in ("/api/categories/999/", "/api/categories/999/rooms/"):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertNotIn("ETag", response.headers)
+                self.assertNotIn("Last-Modified", response.headers)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH="*")
+                self.assertEqual(response.status_code, 404)
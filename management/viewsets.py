@@ -3,13 +3,22 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import (
+    AllowAny,
+    IsAuthenticated,
+    IsAuthenticatedOrReadOnly,
+)
 
 from rest_framework import status
 
 from django.db.models import Q, F
-from django.db import transaction
-from django.utils.dateparse import parse_datetime
+from django.conf import settings
+from django.db import OperationalError
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.utils.datetime_safe import datetime
 
 from hsr_admin.forms import BookingForm, CheckAvailabilityForm, CustomerForm
@@ -17,6 +26,12 @@ from hsr_admin.forms import BookingForm, CheckAvailabilityForm, CustomerForm
 from .forms import CancelRequestForm, NewCustomerForm, NewReservationForm
 
 
+from .fast_serializers import (
+    FastReservationSerializer,
+    FastRoomCategorySerializer,
+    FastRoomSerializer,
+    FastSecureReservationSerializer,
+)
 from .serializers import (
     ReservationSerializer,
     RoomCategorySerializer,
@@ -25,16 +40,92 @@ from .serializers import (
 )
 
 from .models import Customer, Reservation, Room, RoomCategory, generate_cancel_code
-from .managers import RoomManager
+from .cache import catalog_version
+from .managers import MAX_PROVISIONED_ROOMS, RoomManager
+from .pagination import ReservationCursorPagination
+from .filters import FilterError, filter_reservations
+from .exports import EXPORT_FORMATS, export_lines
+from .fieldsets import FieldSet, FieldSetError
+from .occupancy import OccupancyMatrix
+
+import numpy as np
+
+# The longest range (in nights) the availability calendar can be asked for
+MAX_CALENDAR_NIGHTS = 366
+
+# The most stays that can be checked in one batch availability request
+MAX_BATCH_STAYS = 100
+
+
+def catalog_condition(name: str, model=None):
+    """
+    Conditional GET on the catalog version, a request whose If-None-Match or
+    If-Modified-Since still matches is answered 304 from the cache alone.
+    With a model, a pk with no row gets no validators so its 404 is never
+    turned into a 304 (one primary key lookup per request)
+    """
+
+    def exists(request, pk) -> bool:
+        if model is None or pk is None:
+            return True
+        if not hasattr(request, "_catalog_row_exists"):
+            try:
+                request._catalog_row_exists = model.objects.filter(pk=pk).exists()
+            except (TypeError, ValueError):
+                request._catalog_row_exists = False
+        return request._catalog_row_exists
+
+    def etag(request, pk=None):
+        if exists(request, pk):
+            return catalog_version.etag(name, pk)
+
+    def last_modified(request, pk=None):
+        if exists(request, pk):
+            return catalog_version.last_modified()
+
+    return method_decorator(
+        condition(etag_func=etag, last_modified_func=last_modified)
+    )
 
 
-class RoomCategoryViewSet(ViewSet):
+def fast_reads() -> bool:
+    """Whether the list endpoints use the fast read serializers"""
+    return getattr(settings, "FAST_READ_SERIALIZERS", False)
+
+
+def sparse_fields(request: Request, fast_serializer_class):
+    """
+    The FieldSet of the `fields` and `expand` query parameters and the fast
+    serializer built with it, raises FieldSetError if they are invalid
+    """
+    fieldset = FieldSet.from_params(request.query_params)
+    return fieldset, fast_serializer_class(fieldset=fieldset)
+
+
+class FieldSetErrorMixin:
+    def handle_exception(self, exc):
+        if isinstance(exc, FieldSetError):
+            return Response(
+                {"detail": str(exc)},
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+            )
+        return super().handle_exception(exc)
+
+
+class RoomCategoryViewSet(FieldSetErrorMixin, ViewSet):
     permission_classes = (IsAuthenticatedOrReadOnly,)
 
+    @catalog_condition("categories")
     def list(self, request):
-        querysets = RoomCategory.objects.all()
-        return Response(RoomCategorySerializer(querysets, many=True).data)
+        fieldset, serializer = sparse_fields(request, FastRoomCategorySerializer)
+        querysets = serializer.narrow(RoomCategory.objects.all())
+        if fast_reads():
+            return Response(serializer.serialize(querysets))
+        return Response(
+            RoomCategorySerializer(querysets, many=True, fieldset=fieldset).data
+        )
 
+    @catalog_condition("category", RoomCategory)
     def detail(self, request: Request, pk=None):
         """
         TO get a specific room category with the id as pk
@@ -44,16 +135,21 @@ class RoomCategoryViewSet(ViewSet):
             500: Something went wrong on the server
         """
 
+        fieldset, serializer = sparse_fields(request, FastRoomCategorySerializer)
         try:
-            category = RoomCategory.objects.get(pk=pk)
-            return Response(RoomCategorySerializer(category).data)
+            category = serializer.narrow(RoomCategory.objects.all()).get(pk=pk)
+            return Response(RoomCategorySerializer(category, fieldset=fieldset).data)
         except RoomCategory.DoesNotExist:
             return Response(
                 status=status.HTTP_404_NOT_FOUND,
                 data={"detail": "Room Category Not Found"},
             )
 
+    # Routed as /api/categories/{pk}/ by the router
+    retrieve = detail
+
     @action(methods=("GET",), detail=True)
+    @catalog_condition("rooms", RoomCategory)
     def rooms(self, request: Request, pk=None):
         """
         Returns the list of the rooms that has been
@@ -64,17 +160,58 @@ class RoomCategoryViewSet(ViewSet):
             404: The category was not found
         """
 
+        fieldset, serializer = sparse_fields(request, FastRoomSerializer)
         try:
             category = RoomCategory.objects.get(pk=pk)
-            return Response(RoomSerializer(category.rooms, many=True).data)
+            rooms = serializer.narrow(category.rooms.order_by("pk"))
+            if fast_reads():
+                return Response(serializer.serialize(rooms))
+            return Response(RoomSerializer(rooms, many=True, fieldset=fieldset).data)
         except RoomCategory.DoesNotExist:
             return Response(
                 status=status.HTTP_404_NOT_FOUND,
                 data={"detail": "Room Category Not Found"},
             )
 
+    @action(methods=("POST",), detail=True)
+    def provision_rooms(self, request: Request, pk=None):
+        """
+        Creates `count` rooms in the category, numbered from the next free
+        block of room numbers
+        Returns
+            201: The created rooms
+            404: The category was not found
+            406: An invalid count was provided
+        """
+        try:
+            category = RoomCategory.objects.get(pk=pk)
+        except RoomCategory.DoesNotExist:
+            return Response(
+                status=status.HTTP_404_NOT_FOUND,
+                data={"detail": "Room Category Not Found"},
+            )
+
+        try:
+            rooms = RoomManager.provision_rooms(category, int(request.data.get("count")))
+        except (TypeError, ValueError):
+            return Response(
+                {
+                    "detail": f"Count should be a number of rooms between 1 and {MAX_PROVISIONED_ROOMS}"
+                },
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+            )
+
+        return Response(
+            RoomSerializer(rooms, many=True).data, status=status.HTTP_201_CREATED
+        )
+
     @action(methods=("GET",), detail=False)
     def available_rooms(self, request: Request):
+        """
+        Returns the rooms free between `arrival` and `departure` and their
+        categories, `fields` and `expand` apply to the rooms
+        """
+        fieldset, serializer = sparse_fields(request, FastRoomSerializer)
         departure = request.query_params.get("departure")
         arrival = request.query_params.get("arrival")
 
@@ -133,41 +270,266 @@ class RoomCategoryViewSet(ViewSet):
                 status=status.HTTP_406_NOT_ACCEPTABLE,
             )
 
-        available_rooms = RoomManager.available_rooms(
-            None, arrival_date, departure_date
+        available_rooms = serializer.narrow(
+            RoomManager.available_rooms(None, arrival_date, departure_date)
         )
+        if fast_reads():
+            return Response(
+                {
+                    "rooms": serializer.serialize(available_rooms),
+                    "categories": FastRoomCategorySerializer().serialize(
+                        RoomCategory.objects.filter(
+                            pk__in=available_rooms.values("category_id")
+                        ).order_by("pk")
+                    ),
+                }
+            )
         return Response(
             {
-                "rooms": RoomSerializer(available_rooms, many=True).data,
+                "rooms": RoomSerializer(
+                    available_rooms, many=True, fieldset=fieldset
+                ).data,
                 "categories": RoomCategorySerializer(
                     RoomManager.extract_categories(available_rooms), many=True
                 ).data,
             }
         )
 
+    @action(methods=("GET",), detail=False)
+    def calendar(self, request: Request):
+        """
+        Returns the number of free rooms of every category on each night
+        from `start` (defaults to today) for `nights` nights (defaults to 30)
+        and the cheapest category price still available on each night
+        Returns
+            200: The calendar
+            406: Invalid start date or number of nights
+        """
+        start = request.query_params.get("start")
+        nights = request.query_params.get("nights", 30)
+
+        try:
+            start_date = parse_date(start) if start else timezone.localdate()
+        except ValueError:
+            # Well formed but out of range, like 2026-02-30
+            start_date = None
 
-class ReservationViewSet(ViewSet):
-    def list(self, request: Request):
-        before = request.query_params.get("before", None)
-        after = request.query_params.get("after", None)
+        if not start_date:
+            return Response(
+                {
+                    "detail": "An invalid start date was provided, make sure it is a valid date"
+                },
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+            )
 
-        reservations = Reservation.objects.all()
+        try:
+            nights = int(nights)
+        except ValueError:
+            nights = 0
+
+        if nights < 1 or nights > MAX_CALENDAR_NIGHTS:
+            return Response(
+                {
+                    "detail": f"Nights should be a number between 1 and {MAX_CALENDAR_NIGHTS}"
+                },
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+            )
+
+        categories = list(RoomCategory.objects.order_by("price", "pk"))
+        occupancy = OccupancyMatrix.build(start_date, nights)
+        free_counts = occupancy.category_free_counts()
+
+        free = np.array(
+            [free_counts.get(category.pk, np.zeros(nights)) for category in categories]
+        ).reshape(len(categories), nights)
+        prices = np.array([category.price for category in categories], dtype=float)
+
+        # Categories are sorted by price, the first one with a free room on a
+        # night is the cheapest available for that night
+        has_free = free > 0
+        cheapest = [None] * nights
+        if categories:
+            cheapest_rows = has_free.argmax(axis=0)
+            cheapest = [
+                float(prices[row]) if has_free[row, night] else None
+                for night, row in enumerate(cheapest_rows.tolist())
+            ]
+
+        return Response(
+            {
+                "start": start_date,
+                "nights": nights,
+                "dates": occupancy.dates,
+                "categories": [
+                    {
+                        "pk": category.pk,
+                        "title": category.title,
+                        "price": category.price,
+                        "free": free[i].astype(int).tolist(),
+                    }
+                    for i, category in enumerate(categories)
+                ],
+                "cheapest": cheapest,
+            }
+        )
+
+    @action(methods=("POST",), detail=False, permission_classes=(AllowAny,))
+    def batch_availability(self, request: Request):
+        """
+        Checks the availability of many stays at once, the body holds a list
+        of stays {"arrival", "departure", "category" (optional)}
+        Returns
+            200: The free rooms of each stay, in the order they were sent
+            406: A stay is missing or has invalid dates
+        """
+        stays = request.data.get("stays")
+
+        if not isinstance(stays, list) or not stays:
+            return Response(
+                {"detail": "Provide the list of stays to check"},
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+            )
+
+        if len(stays) > MAX_BATCH_STAYS:
+            return Response(
+                {"detail": f"At most {MAX_BATCH_STAYS} stays can be checked at once"},
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+            )
+
+        windows = []
+        for i, stay in enumerate(stays):
+            if not isinstance(stay, dict):
+                stay = {}
+
+            try:
+                arrival_date = parse_datetime(str(stay.get("arrival", "")))
+                departure_date = parse_datetime(str(stay.get("departure", "")))
+            except ValueError:
+                # Well formed but out of range, like 2026-13-01T10:00
+                arrival_date = departure_date = None
+            category = stay.get("category")
+
+            if not arrival_date or not departure_date:
+                return Response(
+                    {
+                        "detail": f"Stay {i} has an invalid arrival or departure date, make sure they are valid dates",
+                    },
+                    status=status.HTTP_406_NOT_ACCEPTABLE,
+                )
+
+            if departure_date <= arrival_date:
+                return Response(
+                    {"detail": f"Stay {i} departure date should be ahead of its arrival date"},
+                    status=status.HTTP_406_NOT_ACCEPTABLE,
+                )
 
-        if before:
             try:
-                before = parse_datetime(before)
-                if before != None:
-                    reservations.filter(departure_date__lte=before)
-            except Exception as e:
-                pass
+                category = int(category) if category is not None else None
+            except (TypeError, ValueError):
+                return Response(
+                    {"detail": f"Stay {i} has an invalid room category"},
+                    status=status.HTTP_406_NOT_ACCEPTABLE,
+                )
+
+            windows.append((category, arrival_date, departure_date))
+
+        results = RoomManager.batch_available_rooms(windows)
+
+        return Response(
+            [
+                {
+                    "arrival": arrival_date,
+                    "departure": departure_date,
+                    "category": category,
+                    "available": len(rooms),
+                    "rooms": rooms,
+                }
+                for (category, arrival_date, departure_date), rooms in zip(
+                    windows, results
+                )
+            ]
+        )
+
+
+class ReservationViewSet(FieldSetErrorMixin, ViewSet):
+    def list(self, request: Request):
+        fieldset, serializer = sparse_fields(
+            request,
+            FastSecureReservationSerializer
+            if request.user.is_anonymous
+            else FastReservationSerializer,
+        )
+        reservations = Reservation.objects.all()
+
+        try:
+            reservations = filter_reservations(reservations, request.query_params)
+        except FilterError as e:
+            return Response(
+                {"detail": str(e)},
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+            )
+
+        paginator = ReservationCursorPagination()
+
+        if fast_reads():
+            page = paginator.paginate_queryset(
+                serializer.values(reservations), request, view=self
+            )
+            return paginator.get_paginated_response(
+                [serializer.to_representation(row) for row in page]
+            )
+
+        page = paginator.paginate_queryset(
+            serializer.narrow(reservations), request, view=self
+        )
 
         if request.user.is_anonymous:
-            return Response(SecureReservationSerializer(reservations, many=True).data)
+            return paginator.get_paginated_response(
+                SecureReservationSerializer(page, many=True, fieldset=fieldset).data
+            )
 
         else:
-            return Response(ReservationSerializer(reservations, many=True).data)
+            return paginator.get_paginated_response(
+                ReservationSerializer(page, many=True, fieldset=fieldset).data
+            )
+
+    @action(("GET",), detail=False, permission_classes=(IsAuthenticated,))
+    def export(self, request: Request):
+        """
+        Streams every reservation matching the list filters with its
+        customer, room and payment, `output` is ndjson (default) or csv
+        Returns
+            200: The streamed export
+            406: An invalid filter or output was provided
+        """
+        export_format = request.query_params.get("output", "ndjson")
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"detail": f"Output should be one of {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+            )
+
+        try:
+            reservations = filter_reservations(
+                Reservation.objects.all(), request.query_params
+            )
+        except FilterError as e:
+            return Response(
+                {"detail": str(e)},
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+            )
+
+        response = StreamingHttpResponse(
+            export_lines(reservations, export_format),
+            content_type=EXPORT_FORMATS[export_format],
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="reservations.{export_format}"'
+        )
+        return response
 
     def retrieve(self, request: Request, pk=None):
+        fieldset, _ = sparse_fields(request, FastSecureReservationSerializer)
         try:
             try:
                 id = int(pk)
@@ -183,6 +545,7 @@ class ReservationViewSet(ViewSet):
             return Response(
                 SecureReservationSerializer(
                     reservation,
+                    fieldset=fieldset,
                 ).data
             )
         except Reservation.DoesNotExist:
@@ -265,18 +628,6 @@ class ReservationViewSet(ViewSet):
 
         try:
             category = RoomCategory.objects.get(pk=booking_data["room"])
-            rooms = RoomManager.available_rooms(category, arrival, departure)
-
-            if rooms.count() < 1:
-                return Response(
-                    status=status.HTTP_406_NOT_ACCEPTABLE,
-                    data={
-                        "detail": "Please select a different room, selected room is not available"
-                    },
-                )
-
-            room = rooms.first()
-
         except RoomCategory.DoesNotExist:
             return Response(
                 status=status.HTTP_406_NOT_ACCEPTABLE,
@@ -292,16 +643,27 @@ class ReservationViewSet(ViewSet):
             departure_date=departure,
             reservated_on=datetime.now(),
             paid=False,
-            room=room,
             guests=request.data["guests"],
             requirement=request.data["requirement"],
         )
 
-        with transaction.atomic():
-            customer.save()
-            reservation.save()
+        try:
+            booked = RoomManager.allocate_room(category, reservation)
+        except OperationalError:
+            return Response(
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                data={"detail": "We are receiving too many bookings, please try again"},
+            )
+
+        if not booked:
+            return Response(
+                status=status.HTTP_406_NOT_ACCEPTABLE,
+                data={
+                    "detail": "The selected room category is sold out for the selected dates, please select a different room"
+                },
+            )
 
-            return Response(SecureReservationSerializer(reservation).data)
+        return Response(SecureReservationSerializer(reservation).data)
 
     @action(("POST",), detail=True)
     def cancel_request(self, request: Request, pk=None):
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -89,6 +90,49 @@ DATABASES = {
     }
 }
 
+# DATABASE_PROFILE=production tunes SQLite for concurrent traffic: WAL
+# journaling, a busy timeout and the pragmas of management.sqlite on every
+# new connection, and persistent connections. See the benchmark_sqlite
+# command for the difference it makes
+DATABASE_PROFILE = os.environ.get("DATABASE_PROFILE", "default")
+
+SQLITE_PRAGMAS = {}
+
+if DATABASE_PROFILE == "production":
+    from management.sqlite import PRODUCTION_PRAGMAS
+
+    SQLITE_PRAGMAS = PRODUCTION_PRAGMAS
+    DATABASES["default"].update(
+        {
+            "CONN_MAX_AGE": 600,
+            "CONN_HEALTH_CHECKS": True,
+            # Seconds to wait for the write lock, in the sqlite3 module
+            "OPTIONS": {"timeout": 20},
+        }
+    )
+
+
+# Caches
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    # Per process, only holds values that may be briefly stale, like the
+    # catalog version behind the ETags of the category endpoints (see
+    # management.cache)
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Free rooms per category and date window, see management.cache. Shared
+    # by every worker so an invalidation reaches all of them, and kept in the
+    # database it describes (the table is created by the migrations)
+    "availability": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "availability_cache",
+        "TIMEOUT": 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -126,6 +170,11 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.AllowAny"],
 }
 
+# The list endpoints serialize `.values()` rows with the serializers in
+# management.fast_serializers instead of the ModelSerializers, the output is
+# the same (see FastSerializerParityTests in management.tests)
+FAST_READ_SERIALIZERS = True
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -145,6 +194,10 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "statics/"
 
+# Hashed and precompressed copy of STATIC_ROOT made by `manage.py build_static`
+# and served by management.assets.serve_asset
+STATIC_BUILD_ROOT = BASE_DIR / "static_build/"
+
 MEDIA_URL = "uploads/"
 MEDIA_ROOT = BASE_DIR / "media/uploads/"
 
@@ -15,13 +15,14 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
 
 from .api import router
 from hsr_admin import urls
+from management.assets import serve_asset
 from django.views.generic import TemplateView
 
 urlpatterns = (
@@ -33,5 +34,5 @@ urlpatterns = (
         path("admin/", include(urls), name="hsr_admin"),
     ]
     + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    + static("/", document_root=settings.STATIC_ROOT)
+    + [re_path(r"^(?P<path>.+)$", serve_asset)]
 )